@@ -1,17 +1,39 @@
 from samson.core.base_object import BaseObject
 from r1cs import R1CSSystem, R1CSConstraint
+from profiling import profiled
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
 
 ##########
 # LABELS #
 ##########
 
 class Label(BaseObject):
+    # The owning system lives in a slot, outside __dict__, so equality and hashing only see `rep`
+    __slots__ = ('_els',)
+
     def __init__(self, rep: str):
-        self.rep = rep
+        self._els = None
+        self.rep  = rep
     
     def __reprdir__(self):
         return ['rep']
 
+    @property
+    def rep(self) -> str:
+        return self.__dict__['rep']
+
+    @rep.setter
+    def rep(self, rep: str):
+        # Keep the owning system's index in step with renames
+        if self._els is not None:
+            self._els._rename(self, rep)
+
+        self.__dict__['rep'] = rep
+
     def is_constant(self):
         return False
 
@@ -24,19 +46,30 @@ class Constant(Label):
 
 class EdgeLabelSystem(BaseObject):
     def __init__(self):
-        self.labels = []
-        self.ctr    = 1
+        self.labels     = []
+        self.ctr        = 1
+        self._positions = {}
+        self._reps      = {}
+
+    def __reprdir__(self):
+        return ['labels', 'ctr']
 
     def generate(self):
         label = Label(f'S{self.ctr}')
         self.ctr += 1
+        self._positions[id(label)] = len(self.labels)
+        self._reps.setdefault(label.rep, label)
         self.labels.append(label)
+        label._els = self
         return label
 
     def build_expression(self, *args):
         values = [0]*(len(self.labels)+1)
         for a in args:
-            if a.is_constant():
+            if not isinstance(a, Label):
+                # Raw constants, e.g. the `1` of an addition constraint
+                values[0] = a
+            elif a.is_constant():
                 values[0] = a.value
             else:
                 values[self[a]+1] = 1
@@ -44,15 +77,31 @@ class EdgeLabelSystem(BaseObject):
         return R1CSExpression(values)
     
 
+    def _rename(self, label: Label, rep: str):
+        if self._reps.get(label.rep) is label:
+            del self._reps[label.rep]
+
+        self._reps.setdefault(rep, label)
+
+
+    def _lookup_rep(self, rep):
+        label = self._reps.get(rep)
+        if label is None:
+            raise KeyError(rep)
+
+        return label
+
+
     def __getitem__(self, rep):
         if type(rep) is Label:
-            return self.labels.index(rep)
-        else:
-            for l in self.labels:
-                if l.rep == rep:
-                    return l
+            position = self._positions.get(id(rep))
+            if position is None:
+                # An equal label that isn't the one we generated
+                position = self._positions[id(self._lookup_rep(rep.rep))]
 
-        raise KeyError
+            return position
+        else:
+            return self._lookup_rep(rep)
 
 
     def build_solution_vector(self, sol: 'Dict[Label, FieldElement]'):
@@ -71,21 +120,52 @@ class R1CSExpression(BaseObject):
         return R1CSExpression([a+b for a,b, in zip(self.values, other.values)])
 
     def __mul__(self, value: int):
-        return R1CSExpression([a*value for a, in self.values])
+        return R1CSExpression([a*value for a in self.values])
 
 
 #########
 # NODES #
 #########
 
+def post_order(roots: list, skip=None) -> list:
+    """
+    Iterative post-order walk over `in_nodes`, visiting each node once. Nodes for which
+    `skip(node)` holds are neither returned nor walked through.
+    """
+    order = []
+    seen  = set()
+
+    for root in roots:
+        if id(root) in seen or (skip and skip(root)):
+            continue
+
+        seen.add(id(root))
+        stack = [(root, iter(root.in_nodes))]
+
+        while stack:
+            node, children = stack[-1]
+            for child in children:
+                if id(child) not in seen and not (skip and skip(child)):
+                    seen.add(id(child))
+                    stack.append((child, iter(child.in_nodes)))
+                    break
+            else:
+                stack.pop()
+                order.append(node)
+
+    return order
+
+
 class Node(BaseObject):
     def __init__(self, label: Label, els: EdgeLabelSystem):
-        self.label     = label
-        self.els       = els
-        self.in_nodes  = []
-        self.out_nodes = []
-        self.out_label = None
-        self._value    = None
+        self.label       = label
+        self.els         = els
+        self.in_nodes    = []
+        self.out_nodes   = []
+        self.out_label   = None
+        self._value      = None
+        self._finalized  = False
+        self._expression = None
 
     def __reprdir__(self):
         return ['label', 'out_label']
@@ -120,12 +200,13 @@ class Node(BaseObject):
 
 
     def finalize(self):
-        if len(self.in_nodes):
-            for node in self.in_nodes:
-                node.finalize()
+        if self._finalized:
+            return
 
-        self.validate()
-        self.try_generate_label()
+        for node in post_order([self], lambda n: n._finalized):
+            node.validate()
+            node.try_generate_label()
+            node._finalized = True
 
 
     def generate_constraint(self):
@@ -134,6 +215,16 @@ class Node(BaseObject):
 
     def build_expression(self):
         self.finalize()
+
+        # Expression vectors are sized by the label count, so rebuild if labels were added since
+        size = len(self.els.labels)
+        if self._expression is None or self._expression[0] != size:
+            self._expression = (size, self._build_expression())
+
+        return self._expression[1]
+
+
+    def _build_expression(self):
         if self.out_label:
             return self.els.build_expression(self.out_label)
         else:
@@ -191,11 +282,10 @@ class AdditionGate(ArithmeticGate):
         return R1CSConstraint(
             (l.build_expression() + r.build_expression()).values,
             self.els.build_expression(1).values,
-            self.build_expression().values
+            list(self.build_expression().values)
         )
 
-    def build_expression(self):
-        self.finalize()
+    def _build_expression(self):
         if self.out_label:
             return self.els.build_expression(self.out_label)
         else:
@@ -217,14 +307,14 @@ class MultiplicationGate(ArithmeticGate):
     def generate_constraint(self):
         self.finalize()
         l,r = self.in_nodes
+        # Expressions are cached per node, so copy them rather than share rows between constraints
         return R1CSConstraint(
-            l.build_expression().values,
-            r.build_expression().values,
-            self.build_expression().values
+            list(l.build_expression().values),
+            list(r.build_expression().values),
+            list(self.build_expression().values)
         )
 
-    def build_expression(self):
-        self.finalize()
+    def _build_expression(self):
         if self.out_label:
             return self.els.build_expression(self.out_label)
         else:
@@ -244,34 +334,56 @@ class MultiplicationGate(ArithmeticGate):
 
 class AlgebraicCircuit(BaseObject):
     def __init__(self, nodes):
-        self.nodes = nodes
-    
+        self.nodes  = nodes
+        self._names = {}
+
+
+    def __reprdir__(self):
+        return ['nodes']
+
 
     def __getitem__(self, name):
-        for n in self.nodes:
-            if n.label.rep == name:
-                return n
-        
-        raise KeyError
+        node = self._names.get(name)
 
+        if node is None or node.label.rep != name:
+            self._names = {}
+            for n in self.nodes:
+                self._names.setdefault(n.label.rep, n)
 
-    def execute(self):
-        results = {}
-        for n in self.nodes:
-            if type(n) is Sink:
-                n.execute()
-
-        for n in self.nodes:
-            if n.out_label:
-                results[n.out_label] = n.value
-        
-        return results
+            node = self._names.get(name)
 
+        if node is None:
+            raise KeyError(name)
 
-    def build_r1cs_system(self):
+        return node
+
+
+    def topological_order(self):
+        """
+        Nodes in the order `finalize` labels them.
+        """
+        return post_order(self.nodes)
+
+
+    def finalize(self):
         for node in self.nodes:
             node.finalize()
 
+
+    def compile(self):
+        return WitnessProgram.compile(self)
+
+
+    def execute(self):
+        program = self.compile()
+        inputs  = {n.label.rep: n.value for n in self.topological_order() if type(n) is Source and not n.label.is_constant()}
+        return program.execute(inputs)
+
+
+    @profiled('r1cs')
+    def build_r1cs_system(self):
+        self.finalize()
+
         constraints = []
         for node in self.nodes:
             constraint = node.generate_constraint()
@@ -282,6 +394,159 @@ class AlgebraicCircuit(BaseObject):
 
 
 
+OP_ADD = 0
+OP_MUL = 1
+
+class WitnessProgram(BaseObject):
+    """
+    Flat instruction tape of `(op, dst, src1, src2)` over an integer slot array. Evaluating
+    a witness is one linear pass with no recursion, and shared subexpressions are computed once.
+    """
+
+    def __init__(self, num_slots: int, constants: list, inputs: dict, tape: list, outputs: list, els: EdgeLabelSystem=None):
+        self.num_slots = num_slots
+        self.constants = constants
+        self.inputs    = inputs
+        self.tape      = tape
+        self.outputs   = outputs
+        self.els       = els
+
+
+    def __reprdir__(self):
+        return ['num_slots', 'inputs']
+
+
+    @staticmethod
+    def compile(circuit: AlgebraicCircuit) -> 'WitnessProgram':
+        circuit.finalize()
+        order = circuit.topological_order()
+        slots = {}
+
+        constants, inputs, tape, outputs = [], {}, [], []
+        for node in order:
+            if type(node) is Sink:
+                slot = slots[id(node.in_nodes[0])]
+
+            else:
+                slot = len(constants) + len(inputs) + len(tape)
+
+                if type(node) is Source:
+                    if node.label.is_constant():
+                        constants.append((slot, node.value))
+                    else:
+                        inputs[node.label.rep] = slot
+
+                else:
+                    l, r = node.in_nodes
+                    op   = OP_MUL if isinstance(node, MultiplicationGate) else OP_ADD
+                    tape.append((op, slot, slots[id(l)], slots[id(r)]))
+
+            slots[id(node)] = slot
+
+            if node.out_label:
+                outputs.append((node.out_label, slot))
+
+        els = order[0].els if order else None
+        return WitnessProgram(len(constants) + len(inputs) + len(tape), constants, inputs, tape, outputs, els)
+
+
+    def execute(self, inputs: dict) -> dict:
+        """
+        Evaluates the circuit for `inputs` (input name -> value) and returns `{out_label: value}`.
+        """
+        return self.execute_batch([inputs])[0]
+
+
+    def execute_batch(self, inputs: list) -> list:
+        """
+        Evaluates many input assignments at once. Each slot holds a column with one value per
+        assignment, so the tape is walked only once.
+        """
+        n     = len(inputs)
+        slots = [None]*self.num_slots
+
+        for slot, value in self.constants:
+            slots[slot] = [value]*n
+
+        for name, slot in self.inputs.items():
+            slots[slot] = [assignment[name] for assignment in inputs]
+
+        for op, dst, a, b in self.tape:
+            if op == OP_MUL:
+                slots[dst] = [x*y for x, y in zip(slots[a], slots[b])]
+            else:
+                slots[dst] = [x+y for x, y in zip(slots[a], slots[b])]
+
+        return [{label: slots[slot][i] for label, slot in self.outputs} for i in range(n)]
+
+
+    def solve_batch(self, F: 'Field', matrix: list, columns: list) -> list:
+        """
+        Evaluates a matrix of inputs (rows are instances, `columns` names the input signals) and
+        returns one solution vector per row in the `EdgeLabelSystem.build_solution_vector` layout.
+        Fields below 2^32 use NumPy uint64 arithmetic when available; larger ones use Python ints.
+        """
+        p       = int(F.characteristic())
+        n       = len(matrix)
+        columns = {name: [int(row[i]) % p for row in matrix] for i, name in enumerate(columns)}
+        layout  = [(self.els[label], slot) for label, slot in self.outputs]
+
+        if np is not None and p < 2**32:
+            slots = self._solve_uint64(p, n, columns)
+        else:
+            slots = self._solve_ints(p, n, columns)
+
+        vectors = [[F(0)]*len(self.els.labels) for _ in range(n)]
+        for position, slot in layout:
+            for vector, value in zip(vectors, slots[slot]):
+                vector[position] = F(int(value))
+
+        return vectors
+
+
+    def _solve_uint64(self, p: int, n: int, columns: dict) -> list:
+        """
+        Vectorized tape evaluation for `p < 2^32`, where the product of two reduced operands
+        fits in a uint64. Wider fields, e.g. the 254-bit pairing fields, go to `_solve_ints`:
+        NumPy object arrays still multiply Python ints one by one and measured no faster.
+        """
+        slots = [None]*self.num_slots
+
+        for slot, value in self.constants:
+            slots[slot] = np.full(n, int(value) % p, dtype=np.uint64)
+
+        for name, slot in self.inputs.items():
+            slots[slot] = np.array(columns[name], dtype=np.uint64)
+
+        # Operands are below 2^32, so neither sums nor products overflow uint64
+        for op, dst, a, b in self.tape:
+            if op == OP_MUL:
+                slots[dst] = (slots[a] * slots[b]) % p
+            else:
+                slots[dst] = (slots[a] + slots[b]) % p
+
+        return slots
+
+
+    def _solve_ints(self, p: int, n: int, columns: dict) -> list:
+        slots = [None]*self.num_slots
+
+        for slot, value in self.constants:
+            slots[slot] = [int(value) % p]*n
+
+        for name, slot in self.inputs.items():
+            slots[slot] = columns[name]
+
+        for op, dst, a, b in self.tape:
+            if op == OP_MUL:
+                slots[dst] = [x*y % p for x, y in zip(slots[a], slots[b])]
+            else:
+                slots[dst] = [(x+y) % p for x, y in zip(slots[a], slots[b])]
+
+        return slots
+
+
+
 library = """
 template subtract() {
     signal input a ;
@@ -1,16 +1,31 @@
-
-from copy import deepcopy
 from samson.core.base_object import BaseObject
 from algebraic_circuit import MultiplicationGate, AdditionGate, EdgeLabelSystem, Source, Sink, Label, AlgebraicCircuit
+from profiling import profiled
+import sys
 
 class Reference(BaseObject):
-    def __init__(self, namespace, name):
+    """
+    Edge to the object `leaf` of `namespace`. The dotted name is only built on request, and
+    the target is resolved once (or bound up front) and then kept as a direct pointer.
+    """
+
+    def __init__(self, namespace, leaf, target=None):
         self.namespace = namespace
-        self.name      = name
-    
+        self.leaf      = leaf
+        self._target   = target
+
+    def __reprdir__(self):
+        return ['name']
+
+    @property
+    def name(self):
+        return f'{self.namespace.get_fqns()}.{self.leaf}'
+
     def resolve(self):
-        containing_ns = self.namespace.get_namespace_by_rns(self.name.rsplit('.', 1)[0])
-        return containing_ns[self.name.rsplit('.', 1)[1]]
+        if self._target is None:
+            self._target = self.namespace[self.leaf]
+
+        return self._target
 
 
 class Namespace(BaseObject):
@@ -19,6 +34,7 @@ class Namespace(BaseObject):
         self.objects  = {}
         self.children = {}
         self.parent   = parent
+        self._fqns    = None
     
 
     def create_or_get_childspace(self, name):
@@ -30,66 +46,22 @@ class Namespace(BaseObject):
 
 
     def get_fqns(self):
-        if self.parent:
-            return f'{self.parent.get_fqns()}.{self.name}'
-        else:
-            return self.name
-
-
-    def get_namespace_by_rns(self, rns: str, force_create: bool=False):
-        """
-        Traverses the namespace tree by its relative name.
-        """
-        fqns = self.get_fqns()
-
-        # RNS is a FQNS and matches us
-        # fqns: 'main.mul.doit'
-        # rns:  'main.mul.doit'
-        if fqns == rns:
-            return self
-        
-        # The RNS refers to a lower FQNS
-        # fqns: 'main.mul'
-        # rns:  'main.mul.doit'
-        elif rns.startswith(fqns):
-            child_space = rns.split(fqns)[1].strip('.')
-            try:
-                return self.children[child_space]
-            except KeyError as e:
-                if force_create:
-                    return self.create_or_get_childspace(child_space)
-
-                raise e
-        
-
-        # The RNS refers to a lower relative namespace
-        # fqns: 'main'
-        # rns:  'mul'
-        elif rns in self.children:
-            return self.children[rns]
-
-        # The RNS refers to a higher namespace or different namespace on the same level
-        # fqns: 'main.mul.doit'
-        # rns:  'main.mul'
-
-        # fqns: 'main.mul.doit1'
-        # rns:  'main.mul.doit2'
-        elif self.parent:
-            return self.parent.get_namespace_by_rns(rns, force_create)
-
-        elif force_create:
-            return self.create_or_get_childspace(rns)
-
-        raise RuntimeError("Cannot traverse further; no higher parent")
+        # Namespaces are never re-parented, so the interned path can be cached
+        if self._fqns is None:
+            if self.parent:
+                self._fqns = sys.intern(f'{self.parent.get_fqns()}.{self.name}')
+            else:
+                self._fqns = sys.intern(self.name)
 
+        return self._fqns
 
 
     def __reprdir__(self):
         return ['name']
 
     
-    def ref(self, name):
-        return Reference(self, f'{self.get_fqns()}.{name}')
+    def ref(self, name, target=None):
+        return Reference(self, name, target)
 
 
     def __getattr__(self, name):
@@ -132,14 +104,6 @@ class Namespace(BaseObject):
             self.objects[curr_part] = value
     
 
-    def copy(self, parent, namespace, ns_translation):
-        new_obj = namespace.create_or_get_childspace(self.name)
-        for k,v in self.objects.items():
-            new_obj[k] = v.copy(parent, new_obj, ns_translation)
-        
-        return new_obj
-
-
 
 class ASTObject(BaseObject):
     def __init__(self, name, els=None):
@@ -156,8 +120,10 @@ class ASTObject(BaseObject):
 
 
     def set(self, other: 'ASTObject'):
-        self.in_edges.append(other.parent.namespace.ref(other.name))
-        other.out_edges.append(self.parent.namespace.ref(self.name))
+        self.in_edges.append(other.ref())
+        other.out_edges.append(self.ref())
+        _invalidate_body(self.parent)
+        _invalidate_body(other.parent)
     
 
     def build(self):
@@ -171,29 +137,11 @@ class ASTObject(BaseObject):
         self._last_built = None
 
 
-    def copy(self, parent, namespace, ns_translation):
-        new_obj = self.__class__(name=self.name, els=self.els)
-
-        def translate_edges(edges):
-            new_edges = []
-            for ref in edges:
-                # Translate FQNS
-                new_parts = []
-                for part in ref.name.split('.')[:-1]:
-                    new_parts.append(ns_translation.get(part, part))
-                
-                # Recreate in new namespace tree
-                new_fqns = '.'.join(new_parts)
-                ref_ns   = namespace.get_namespace_by_rns(new_fqns, force_create=True)
-                new_ref  = ref_ns.ref(ref.name.split('.')[-1])
-                new_edges.append(new_ref)
-
-            return new_edges
-
-        new_obj.in_edges  = translate_edges(self.in_edges)
-        new_obj.out_edges = translate_edges(self.out_edges)
-        new_obj.parent    = parent
-        return new_obj
+    def ref(self) -> Reference:
+        """
+        Reference to this object with its target already bound.
+        """
+        return self.parent.namespace.ref(self.name, self)
 
 
 class Input(ASTObject):
@@ -268,12 +216,104 @@ class ADD(BinaryOperator):
     LABEL = "+"
 
 
+def _invalidate_body(owner):
+    # Wiring anything inside a template, including its nested components, changes its body
+    while owner is not None:
+        if type(owner) is Template:
+            owner._body = None
+            break
+
+        owner = owner.parent
+
+
+
+class TemplateBody(BaseObject):
+    """
+    A template compiled once into flat arrays. Every object of the template, including those
+    of nested components, gets a slot; `entries[i]` is `(owner_slot, key, cls, name)` with
+    `owner_slot` None for top-level objects, and edges are lists of slots. Instantiating is
+    then one linear pass instead of a recursive copy with edge path translation.
+
+    The body is shared by every instance, but each instance still gets its own objects:
+    ports are wired with `.set()` and circuits are built by walking those objects, so an
+    instance can't be just an offset into the body.
+    """
+
+    def __init__(self, template: 'Template'):
+        self.entries   = []
+        self.in_edges  = []
+        self.out_edges = []
+
+        objects = []
+        def add(owner_slot, namespace, components_first):
+            items = list(namespace.objects.items())
+            if components_first:
+                items = [i for i in items if type(i[1]) is Component] + [i for i in items if type(i[1]) is not Component]
+
+            for key, obj in items:
+                slot = len(objects)
+                self.entries.append((owner_slot, key, type(obj), obj.name))
+                objects.append(obj)
+
+                if type(obj) is Component:
+                    add(slot, obj.namespace, False)
+
+        # Components are created first to match the order the original objects were added in
+        add(None, template.namespace, True)
+
+        slots = {id(obj): slot for slot, obj in enumerate(objects)}
+        for obj in objects:
+            if type(obj) is Component:
+                self.in_edges.append([])
+                self.out_edges.append([])
+            else:
+                try:
+                    self.in_edges.append([slots[id(ref.resolve())] for ref in obj.in_edges])
+                    self.out_edges.append([slots[id(ref.resolve())] for ref in obj.out_edges])
+                except KeyError:
+                    raise RuntimeError(f"{obj.name} is wired outside of template {template.name}")
+
+
+    def __reprdir__(self):
+        return ['entries']
+
+
+    def instantiate(self, component: 'Component'):
+        els     = component.els
+        objects = []
+
+        for owner_slot, key, cls, name in self.entries:
+            owner = component if owner_slot is None else objects[owner_slot]
+
+            if cls is Component:
+                obj = Component(name=name, els=els, namespace=owner.namespace.create_or_get_childspace(key), parent=owner)
+            else:
+                obj        = cls(name=name, els=els)
+                obj.parent = owner
+
+            owner.namespace.objects[key] = obj
+            objects.append(obj)
+
+        for obj, in_edges, out_edges in zip(objects, self.in_edges, self.out_edges):
+            if in_edges:
+                obj.in_edges = [objects[slot].ref() for slot in in_edges]
+
+            if out_edges:
+                obj.out_edges = [objects[slot].ref() for slot in out_edges]
+
+
+
 class Template(BaseObject):
     def __init__(self, name=None, els=None):
         self.name      = name
         self.els       = els
         self.namespace = Namespace(name)
         self.parent    = None
+        self._body     = None
+
+
+    def __reprdir__(self):
+        return ['name']
 
 
     def __getattr__(self, name):
@@ -290,9 +330,17 @@ class Template(BaseObject):
         obj.els    = self.els
         obj.parent = self
         self.namespace[obj.name] = obj
+        self._body = None
         return obj
 
 
+    def compile(self) -> TemplateBody:
+        if self._body is None:
+            self._body = TemplateBody(self)
+
+        return self._body
+
+
     def instantiate(self, name, parent=None):
         els = parent.els if parent else self.els
 
@@ -302,23 +350,13 @@ class Template(BaseObject):
         else:
             namespace = Namespace(name)
 
-        component      = Component(name=name, els=els, namespace=namespace, parent=parent)
-        ns_translation = {self.namespace.name: name}
+        component = Component(name=name, els=els, namespace=namespace, parent=parent)
 
         if parent:
             parent.namespace[name] = component
+            _invalidate_body(parent)
 
-        # Do components first to prevent dependency issues
-        for k,v in self.namespace.objects.items():
-            if v.is_a(Component):
-                new_obj                = v.copy(component, component.namespace, ns_translation)
-                component.namespace[k] = new_obj
-
-        for k,v in self.namespace.objects.items():
-            if not v.is_a(Component):
-                new_obj                = v.copy(component, component.namespace, ns_translation)
-                component.namespace[k] = new_obj
-
+        self.compile().instantiate(component)
         return component
 
 
@@ -347,16 +385,13 @@ class Component(BaseObject):
                 nodes.extend(v._flatten())
             else:
                 nodes.append(v.build())
-        return list(set(nodes))
 
+        # Duplicates are the same built node reached through several ASG objects, so dedupe by
+        # identity and in insertion order so the label layout doesn't depend on the hash seed
+        return list({id(node): node for node in nodes}.values())
 
+
+    @profiled('circuit')
     def build_circuit(self):
         return AlgebraicCircuit(self._flatten())
 
-
-    def copy(self, parent, namespace, ns_translation):
-        new_obj              = self.__class__(name=self.name, els=self.els)
-        namespace[self.name] = self
-        new_obj.parent       = parent
-        new_obj.namespace    = self.namespace.copy(new_obj, namespace, ns_translation)
-        return new_obj
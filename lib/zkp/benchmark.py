@@ -0,0 +1,260 @@
+"""
+Times every stage of the pipeline (lex, circuit, R1CS, QAP, witness, CRS, prove, verify) on
+synthetic circuits of growing size and reports how each stage scales.
+
+    python benchmark.py --shapes chain fan_in repeated --min-log 4 --max-log 10 --output results.json
+
+Proofs run on a supersingular curve `y^2 = x^3 + x` over `GF(p)` with embedding degree 2,
+generated for a scalar field of `--bits` bits. It has the same pairing structure as the
+production curves but keeps the Tate pairing cheap enough for large sweeps.
+"""
+from samson.math.algebra.curves.weierstrass_curve import WeierstrassCurve
+from samson.math.algebra.fields.finite_field import FiniteField
+from samson.math.general import find_prime, is_prime, random_int
+from samson.math.symbols import Symbol
+from samson.math.all import ZZ
+from field import PrimeField
+from groth16 import CRS, Groth16Parameters, Groth16Proof, SimulationTrapdoor
+from lexer import Lexer
+from profiling import Profiler, stage
+from qap import QAPSystem
+import argparse
+import json
+import math
+
+STAGES = ['lex', 'circuit', 'r1cs', 'qap', 'witness', 'crs', 'prove', 'verify']
+
+
+MULTIPLIER = """
+template Multiplier() {
+    signal input a
+    signal input b
+    signal output c
+    c <== a*b
+}
+"""
+
+ADDER = """
+template Adder() {
+    signal input a
+    signal input b
+    signal output c
+    c <== a + b
+}
+"""
+
+
+def chain_source(n: int) -> tuple:
+    """
+    `n` multipliers in series: `z = x*y^n`. Returns the source and its input names.
+    """
+    lines = ['template Chain() {', '    signal input x', '    signal input y', '    signal output z']
+    for i in range(n):
+        lines += [
+            f'    component m{i} = Multiplier()',
+            f"    m{i}.a <== {'x' if i == 0 else f'm{i-1}.c'}",
+            f'    m{i}.b <== y'
+        ]
+
+    lines += [f'    z <== m{n-1}.c', '}', 'component main = Chain()']
+    return MULTIPLIER + '\n'.join(lines) + '\n', ['x', 'y']
+
+
+def fan_in_source(n: int) -> tuple:
+    """
+    The sum of `n+1` inputs through `n` adders.
+    """
+    inputs = [f'x{i}' for i in range(n+1)]
+    lines  = ['template FanIn() {'] + [f'    signal input {name}' for name in inputs] + ['    signal output s']
+    for i in range(n):
+        lines += [
+            f'    component a{i} = Adder()',
+            f"    a{i}.a <== {'x0' if i == 0 else f'a{i-1}.c'}",
+            f'    a{i}.b <== x{i+1}'
+        ]
+
+    lines += [f'    s <== a{n-1}.c', '}', 'component main = FanIn()']
+    return ADDER + '\n'.join(lines) + '\n', inputs
+
+
+def repeated_source(n: int) -> tuple:
+    """
+    `n/2` independent copies of a two-multiplier template over shared inputs.
+    """
+    copies = max(1, n // 2)
+    lines  = ['template Product() {', '    signal input x1', '    signal input x2', '    signal input x3', '    signal output y']
+    lines += [
+        '    component m1 = Multiplier()',
+        '    component m2 = Multiplier()',
+        '    m1.a <== x1',
+        '    m1.b <== x2',
+        '    m2.a <== m1.c',
+        '    m2.b <== x3',
+        '    y <== m2.c',
+        '}',
+        'template Repeated() {',
+        '    signal input x1',
+        '    signal input x2',
+        '    signal input x3'
+    ]
+
+    lines += [f'    signal output y{i}' for i in range(copies)]
+    for i in range(copies):
+        lines += [
+            f'    component p{i} = Product()',
+            f'    p{i}.x1 <== x1',
+            f'    p{i}.x2 <== x2',
+            f'    p{i}.x3 <== x3',
+            f'    y{i} <== p{i}.y'
+        ]
+
+    lines += ['}', 'component main = Repeated()']
+    return MULTIPLIER + '\n'.join(lines) + '\n', ['x1', 'x2', 'x3']
+
+
+SHAPES = {
+    'chain': chain_source,
+    'fan_in': fan_in_source,
+    'repeated': repeated_source
+}
+
+
+def supersingular_parameters(bits: int) -> Groth16Parameters:
+    """
+    Groth16 parameters on `y^2 = x^3 + x` over `GF(p)`, `p = 4hr - 1`, for a random `bits`-bit
+    prime `r`. The curve has `p + 1` points and embedding degree 2. G1 is the `r`-torsion over
+    `GF(p)` and G2 its image under the distortion map `(x, y) -> (-x, i*y)`, so the
+    pairing is nondegenerate.
+    """
+    r = find_prime(bits)
+    h = 1
+    while not is_prime(4*h*r - 1):
+        h += 1
+
+    p  = 4*h*r - 1
+    Fp = ZZ/ZZ(p)
+    i  = Symbol('i')
+    _  = Fp[i]
+    K  = FiniteField(p, 2, reducing_poly=i**2 + 1)
+    E  = WeierstrassCurve(K(1), K(0))
+
+    while True:
+        x   = Fp(random_int(p))
+        rhs = x**3 + x
+        if rhs**((p-1) // 2) != Fp.one:
+            continue
+
+        g1 = E(int(x), int(rhs.sqrt()))*(4*h)
+        if g1 != E.zero:
+            break
+
+    g2 = E(-K(g1.x), K(i)*g1.y)
+    return Groth16Parameters(G1=E, G2=E, g1=g1, g2=g2, Fr=PrimeField(r))
+
+
+def run_pipeline(source: str, inputs: list, params: Groth16Parameters, count_ops: bool=False) -> dict:
+    """
+    Runs one circuit through the whole pipeline under a `Profiler`. Returns the number of
+    constraints, the time of each stage and the operation counts.
+    """
+    Fr = params.Fr
+
+    with Profiler(count_ops=count_ops) as prof:
+        prog    = Lexer().lex(source)
+        main    = prog.components['main']
+        circuit = main.build_circuit()
+        r1cs    = circuit.build_r1cs_system()
+        qap     = QAPSystem.from_r1cs_system(Fr, r1cs)
+
+        with stage('witness'):
+            for name in inputs:
+                circuit[name].set_value(Fr.random())
+
+            S = main.els.build_solution_vector(circuit.execute())
+
+        # Any split of S into instance and witness is a valid statement; keep one public signal
+        I, W = S[:1], S[1:]
+
+        crs   = CRS.generate(qap, params, SimulationTrapdoor.generate(Fr), num_instances=len(I))
+        proof = Groth16Proof.generate(crs, I, W)
+        valid = proof.verify(I)
+
+    if not valid:
+        raise RuntimeError("Benchmark proof failed to verify")
+
+    stages = prof.root.children
+    return {
+        'constraints': len(r1cs.constraints),
+        'stages': {name: stages[name].time for name in STAGES if name in stages},
+        'counts': prof.totals
+    }
+
+
+def scaling_exponents(results: list) -> dict:
+    """
+    Least-squares slope of log(time) against log(constraints) per stage, i.e. `k` in
+    `time ~ constraints^k`.
+    """
+    exponents = {}
+    for name in STAGES:
+        points = [(math.log(r['constraints']), math.log(r['stages'][name])) for r in results if r['stages'].get(name)]
+        if len(points) < 2:
+            continue
+
+        mx  = sum([x for x, _ in points]) / len(points)
+        my  = sum([y for _, y in points]) / len(points)
+        var = sum([(x - mx)**2 for x, _ in points])
+        if var:
+            exponents[name] = sum([(x - mx)*(y - my) for x, y in points]) / var
+
+    return exponents
+
+
+def run(shapes: list, sizes: list, bits: int=32, count_ops: bool=False, params: Groth16Parameters=None, log=None) -> dict:
+    if max(sizes) >= 2**bits:
+        raise ValueError(f"A {bits}-bit scalar field can't interpolate {max(sizes)} constraints")
+
+    params  = params or supersingular_parameters(bits)
+    results = {}
+
+    for shape in shapes:
+        runs = []
+        for n in sizes:
+            source, inputs = SHAPES[shape](n)
+            result         = run_pipeline(source, inputs, params, count_ops)
+            result['size'] = n
+            runs.append(result)
+
+            if log:
+                times = ' '.join([f'{name}={t:.3f}s' for name, t in result['stages'].items()])
+                log(f"{shape:>9} n={n:<6} constraints={result['constraints']:<6} {times}")
+
+        results[shape] = {'runs': runs, 'exponents': scaling_exponents(runs)}
+
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--shapes', nargs='+', default=list(SHAPES), choices=list(SHAPES))
+    parser.add_argument('--min-log', type=int, default=4, help='smallest size as a power of two')
+    parser.add_argument('--max-log', type=int, default=10, help='largest size as a power of two (up to 16)')
+    parser.add_argument('--bits', type=int, default=32, help='bits of the scalar field')
+    parser.add_argument('--count-ops', action='store_true', help='count field, curve and pairing operations')
+    parser.add_argument('--output', help='write the results as JSON')
+    args = parser.parse_args()
+
+    sizes   = [2**k for k in range(args.min_log, args.max_log+1)]
+    results = run(args.shapes, sizes, args.bits, args.count_ops, log=print)
+
+    for shape, data in results.items():
+        exponents = ' '.join([f'{name}={k:.2f}' for name, k in data['exponents'].items()])
+        print(f'{shape:>9} scaling: {exponents}')
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
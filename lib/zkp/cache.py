@@ -0,0 +1,80 @@
+from samson.core.base_object import BaseObject
+from samson.math.symbols import Symbol
+from qap import QAPSystem
+from serialization import PolynomialCodec, SectionFile, write_sections
+import hashlib
+import json
+import os
+
+
+class CompileCache(BaseObject):
+    """
+    On-disk store of compiled QAPs, content-addressed by the source text, field modulus and
+    compiler version. Each entry is a `.qap` section file and a `.json` manifest that is
+    written last so partial entries are never read.
+    """
+
+    def __init__(self, directory: str):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+
+
+    def __reprdir__(self):
+        return ['directory']
+
+
+    @staticmethod
+    def key(source: str, F: 'Field', version: int) -> str:
+        h = hashlib.sha256()
+        for part in (source, str(int(F.characteristic())), str(version)):
+            h.update(part.encode())
+            h.update(b'\x00')
+
+        return h.hexdigest()
+
+
+    def _path(self, key: str, ext: str) -> str:
+        return os.path.join(self.directory, f'{key}.{ext}')
+
+
+    def _qap_codec(self, F: 'Field', length: int) -> PolynomialCodec:
+        return PolynomialCodec(F[Symbol('x')], length)
+
+
+    def load(self, key: str, F: 'Field'):
+        """
+        Returns `(labels, qap)` for a cached entry, or None on a miss.
+        """
+        try:
+            with open(self._path(key, 'json')) as f:
+                manifest = json.load(f)
+        except FileNotFoundError:
+            return None
+
+        codec = self._qap_codec(F, manifest['length'])
+        with SectionFile(self._path(key, 'qap')) as sections:
+            T          = sections.section('QAP_T', codec)[0]
+            Ax, Bx, Cx = [list(sections.section(name, codec)) for name in ('QAP_A', 'QAP_B', 'QAP_C')]
+
+        return manifest['labels'], QAPSystem(T, Ax, Bx, Cx)
+
+
+    def store(self, key: str, F: 'Field', labels: list, qap: QAPSystem):
+        length = qap.T.degree() + 1
+        codec  = self._qap_codec(F, length)
+
+        # Write to temporary names first so concurrent readers never see half an entry
+        tmp = {ext: self._path(key, f'{ext}.{os.getpid()}.tmp') for ext in ('qap', 'json')}
+
+        write_sections(tmp['qap'], [
+            ('QAP_T', codec, [qap.T]),
+            ('QAP_A', codec, qap.Ax),
+            ('QAP_B', codec, qap.Bx),
+            ('QAP_C', codec, qap.Cx)
+        ])
+
+        with open(tmp['json'], 'w') as f:
+            json.dump({'labels': labels, 'length': length}, f)
+
+        for ext in ('qap', 'json'):
+            os.replace(tmp[ext], self._path(key, ext))
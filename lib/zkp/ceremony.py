@@ -0,0 +1,257 @@
+from samson.core.base_object import BaseObject
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from curve import batch_normalize, jacobian_mul, msm, to_jacobian
+from pairing import pairing_check
+from serialization import PointCodec, SectionFile, write_header, FLAG_COMPRESSED
+import os
+
+TAU_G1 = 'TAU_G1'
+TAU_G2 = 'TAU_G2'
+
+
+def _decode_chunk(codec: PointCodec, data: bytes) -> list:
+    return [codec.decode(data[i:i+codec.size]) for i in range(0, len(data), codec.size)]
+
+
+def _scale_chunk(codec: PointCodec, data: bytes, x: int, start: int, r: int) -> bytes:
+    """
+    Multiplies the points `P_start, P_start+1, ...` encoded in `data` by `x^start, x^(start+1), ...`.
+    """
+    points = _decode_chunk(codec, data)
+    a      = codec.curve.a
+    scalar = pow(x, start, r)
+    scaled = []
+
+    for P in points:
+        scaled.append(jacobian_mul(to_jacobian(P), scalar, a))
+        scalar = scalar*x % r
+
+    return b''.join([codec.encode(P) for P in batch_normalize(scaled, codec.curve)])
+
+
+def _map_ordered(fn, jobs, processes: int=None):
+    """
+    Yields `fn(*job)` for each job in order. With `processes`, jobs run on a process pool with
+    at most two per worker in flight, so only a few chunks are ever held in memory.
+    """
+    if not processes:
+        for job in jobs:
+            yield fn(*job)
+
+        return
+
+    with ProcessPoolExecutor(processes) as executor:
+        pending = deque()
+        for job in jobs:
+            pending.append(executor.submit(fn, *job))
+
+            if len(pending) >= 2*processes:
+                yield pending.popleft().result()
+
+        while pending:
+            yield pending.popleft().result()
+
+
+
+class TauContribution(BaseObject):
+    """
+    Public record of a contribution: the contributor's secret `x` in G1 and G2.
+    """
+
+    def __init__(self, g1_x: 'WeierstrassPoint', g2_x: 'WeierstrassPoint'):
+        self.g1_x = g1_x
+        self.g2_x = g2_x
+
+
+    def __reprdir__(self):
+        return ['g1_x', 'g2_x']
+
+
+
+class PowersOfTau(BaseObject):
+    """
+    Multi-party powers of tau: `[tau^j]_1` and `[tau^j]_2` for `j < num_powers`, i.e. the
+    `CRS_G1[1]` and `CRS_G2[3]` layout. Each contributor multiplies the j-th powers by `x^j`,
+    so tau is the product of every contributor's secret and nobody learns it. Points are
+    streamed through section files in chunks and never all held in memory.
+    """
+
+    def __init__(self, filepath: str, params: 'Groth16Parameters'):
+        self.filepath   = filepath
+        self.params     = params
+        self.file       = SectionFile(filepath)
+        compressed      = bool(self.file.flags & FLAG_COMPRESSED)
+        self.g1_codec   = PointCodec(params.g1.curve, compressed)
+        self.g2_codec   = PointCodec(params.g2.curve, compressed)
+        self.num_powers = self.file.sections[TAU_G1][1]
+
+
+    def __reprdir__(self):
+        return ['filepath', 'num_powers']
+
+
+    def __enter__(self):
+        return self
+
+
+    def __exit__(self, *args):
+        self.close()
+
+
+    def close(self):
+        """
+        Unmaps the ceremony file. Its power sections can't be read afterwards.
+        """
+        self.file.close()
+
+
+    @property
+    def g1_powers(self) -> 'LazySection':
+        return self.file.section(TAU_G1, self.g1_codec)
+
+
+    @property
+    def g2_powers(self) -> 'LazySection':
+        return self.file.section(TAU_G2, self.g2_codec)
+
+
+    def _codecs(self):
+        return ((TAU_G1, self.g1_codec), (TAU_G2, self.g2_codec))
+
+
+    @staticmethod
+    def initialize(filepath: str, params: 'Groth16Parameters', num_powers: int, compressed: bool=True) -> 'PowersOfTau':
+        """
+        Writes the starting point of a ceremony, i.e. `tau = 1`.
+        """
+        if num_powers < 2:
+            raise ValueError("A ceremony needs at least two powers")
+
+        g1 = PointCodec(params.g1.curve, compressed)
+        g2 = PointCodec(params.g2.curve, compressed)
+
+        with open(filepath, 'wb') as f:
+            write_header(f, [(TAU_G1, num_powers, g1.size), (TAU_G2, num_powers, g2.size)], FLAG_COMPRESSED if compressed else 0)
+
+            for codec, g in ((g1, params.g1), (g2, params.g2)):
+                data = codec.encode(g)
+                for _ in range(num_powers):
+                    f.write(data)
+
+        return PowersOfTau(filepath, params)
+
+
+    def contribute(self, filepath: str, x: 'FieldElement'=None, processes: int=None, chunk_size: int=1024) -> TauContribution:
+        """
+        Writes this ceremony with the secret `x` mixed in to `filepath` and returns the public
+        record needed to verify it. Chunks are scaled on `processes` workers if given.
+        The caller is responsible for discarding `x`.
+        """
+        Fr = self.params.Fr
+        r  = int(Fr.characteristic())
+        if x is None:
+            x = Fr.mul_group().random().val
+
+        x = int(x) % r
+        if not x:
+            raise ValueError("Contribution must be nonzero")
+
+        # Truncating the file would clobber the powers still being read through the map
+        if os.path.exists(filepath) and os.path.samefile(filepath, self.filepath):
+            raise ValueError("Contribution can't overwrite the ceremony it reads from")
+
+        with open(filepath, 'wb') as f:
+            write_header(f, [(name, self.num_powers, codec.size) for name, codec in self._codecs()], self.file.flags)
+
+            for name, codec in self._codecs():
+                jobs = ((codec, self.file.raw(name, start, chunk_size), x, start, r) for start in range(0, self.num_powers, chunk_size))
+                for data in _map_ordered(_scale_chunk, jobs, processes):
+                    f.write(data)
+
+        return TauContribution(self.params.g1*x, self.params.g2*x)
+
+
+    def _chunks(self, name: str, codec: PointCodec, chunk_size: int):
+        """
+        Yields overlapping chunks `P_i..P_i+chunk_size` so consecutive pairs are never split.
+        """
+        for start in range(0, self.num_powers-1, chunk_size):
+            yield _decode_chunk(codec, self.file.raw(name, start, chunk_size+1))
+
+
+    def _consistency_pairs(self, chunk_size: int) -> list:
+        """
+        The powers are consistent iff `P_{j+1} = tau*P_j` in both groups. With random weights
+        `rho_j`, that is `e(sum rho_j*G1_j, [tau]_2) = e(sum rho_j*G1_{j+1}, g2)` and likewise
+        for G2, which only needs four MSMs streamed over the file.
+        """
+        Fr   = self.params.Fr
+        Frm  = Fr.mul_group()
+        g1   = self.params.g1
+        g2   = self.params.g2
+        g1_0 = g1.ring.zero
+        g2_0 = g2.ring.zero
+
+        sums = []
+        for (name, codec), zero in zip(self._codecs(), (g1_0, g2_0)):
+            lhs, rhs = zero, zero
+            for chunk in self._chunks(name, codec, chunk_size):
+                rho = [Frm.random().val for _ in chunk[:-1]]
+                lhs = lhs + msm(chunk[:-1], rho, zero)
+                rhs = rhs + msm(chunk[1:], rho, zero)
+
+            sums.append((lhs, rhs))
+
+        (g1_lhs, g1_rhs), (g2_lhs, g2_rhs) = sums
+        return [(g1_lhs, self.g2_powers[1]), (-g1_rhs, g2), (self.g1_powers[1], g2_lhs), (-g1, g2_rhs)]
+
+
+    def _check(self, pairs: list) -> bool:
+        """
+        Checks `e(P_1, Q_1)*e(P_2, Q_2) == 1` for every group of two pairs with one
+        multi-pairing, each group raised to a random power.
+        """
+        Frm      = self.params.Fr.mul_group()
+        weighted = []
+        for i in range(0, len(pairs), 2):
+            z = int(Frm.random().val)
+            weighted.extend([(P*z, Q) for P, Q in pairs[i:i+2]])
+
+        return pairing_check(weighted, self.params.Fr.characteristic())
+
+
+    def verify(self, chunk_size: int=1024) -> bool:
+        """
+        Checks that the file holds powers of a single tau starting from the generators.
+        """
+        if self.g1_powers[0] != self.params.g1 or self.g2_powers[0] != self.params.g2:
+            return False
+
+        return self._check(self._consistency_pairs(chunk_size))
+
+
+    def verify_contribution(self, previous: 'PowersOfTau', contribution: TauContribution, chunk_size: int=1024) -> bool:
+        """
+        Checks that this ceremony is `previous` with the secret behind `contribution` mixed in,
+        and that its powers are consistent. All pairing equations share one final exponentiation.
+        """
+        g1, g2 = self.params.g1, self.params.g2
+        if self.num_powers != previous.num_powers or contribution.g1_x == g1.ring.zero:
+            return False
+
+        if self.g1_powers[0] != g1 or self.g2_powers[0] != g2:
+            return False
+
+        pairs = [
+            # The G1 and G2 records hide the same x
+            (contribution.g1_x, g2), (-g1, contribution.g2_x),
+
+            # tau' = tau*x
+            (self.g1_powers[1], g2), (-previous.g1_powers[1], contribution.g2_x),
+
+            # The G2 powers use the same tau' as the G1 powers
+            (g1, self.g2_powers[1]), (-self.g1_powers[1], g2)
+        ]
+
+        return self._check(pairs + self._consistency_pairs(chunk_size))
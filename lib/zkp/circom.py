@@ -0,0 +1,242 @@
+from samson.core.base_object import BaseObject
+from field import PrimeField
+from r1cs import R1CSSystem, R1CSConstraint
+import struct
+
+R1CS_MAGIC   = b'r1cs'
+R1CS_VERSION = 1
+WTNS_MAGIC   = b'wtns'
+WTNS_VERSION = 2
+
+R1CS_HEADER      = 1
+R1CS_CONSTRAINTS = 2
+R1CS_WIRE2LABEL  = 3
+
+WTNS_HEADER = 1
+WTNS_DATA   = 2
+
+
+def field_size(prime: int) -> int:
+    """
+    Bytes per field element; circom rounds up to whole 64-bit words.
+    """
+    return ((int(prime).bit_length() - 1) // 64 + 1) * 8
+
+
+def _read(f, fmt: str):
+    return struct.unpack(fmt, f.read(struct.calcsize(fmt)))
+
+
+def _read_int(f, n8: int) -> int:
+    return int.from_bytes(f.read(n8), 'little')
+
+
+def _sections(f, magic: bytes):
+    """
+    Yields `(type, size)` for each section, leaving `f` at the start of its data.
+    Sections are skipped if the caller doesn't consume them.
+    """
+    file_magic, version, num_sections = _read(f, '<4sII')
+    if file_magic != magic:
+        raise ValueError(f'Not a {magic.decode()} file')
+
+    for _ in range(num_sections):
+        sec_type, size = _read(f, '<IQ')
+        start = f.tell()
+        yield sec_type, size
+        f.seek(start + size)
+
+
+def _section_index(f, magic: bytes) -> dict:
+    """
+    Maps each section type to the offset of its data. circom doesn't fix the order of sections,
+    so readers look the header up here before seeking to the data it describes.
+    """
+    return {sec_type: f.tell() for sec_type, _ in _sections(f, magic)}
+
+
+def _seek_section(f, index: dict, sec_type: int, name: str):
+    if sec_type not in index:
+        raise ValueError(f'{f.name} has no {name} section')
+
+    f.seek(index[sec_type])
+
+
+class _SectionWriter(object):
+    """
+    Writes a section header, then patches in the size once the data is written.
+    """
+
+    def __init__(self, f, sec_type: int):
+        self.f        = f
+        self.sec_type = sec_type
+
+    def __enter__(self):
+        self.f.write(struct.pack('<IQ', self.sec_type, 0))
+        self.start = self.f.tell()
+        return self.f
+
+    def __exit__(self, *args):
+        end = self.f.tell()
+        self.f.seek(self.start - 8)
+        self.f.write(struct.pack('<Q', end - self.start))
+        self.f.seek(end)
+
+
+
+class CircomR1CS(BaseObject):
+    def __init__(self, F: 'Field', num_wires: int, num_pub_out: int, num_pub_in: int, num_prv_in: int, num_labels: int, system: R1CSSystem, wire_to_label: list=None):
+        self.F             = F
+        self.num_wires     = num_wires
+        self.num_pub_out   = num_pub_out
+        self.num_pub_in    = num_pub_in
+        self.num_prv_in    = num_prv_in
+        self.num_labels    = num_labels
+        self.system        = system
+        self.wire_to_label = wire_to_label
+
+
+    def __reprdir__(self):
+        return ['F', 'num_wires', 'num_pub_out', 'num_pub_in', 'num_prv_in']
+
+
+    @property
+    def num_instances(self) -> int:
+        return self.num_pub_out + self.num_pub_in
+
+
+
+def _read_r1cs_header(f):
+    n8,    = _read(f, '<I')
+    prime  = _read_int(f, n8)
+    num_wires, num_pub_out, num_pub_in, num_prv_in, num_labels, num_constraints = _read(f, '<IIIIQI')
+    return n8, prime, num_wires, num_pub_out, num_pub_in, num_prv_in, num_labels, num_constraints
+
+
+def iter_r1cs_constraints(filepath: str):
+    """
+    Streams the constraints of a circom `.r1cs` file as `(A, B, C)` dicts of wire -> int coefficient.
+    """
+    with open(filepath, 'rb') as f:
+        index = _section_index(f, R1CS_MAGIC)
+        _seek_section(f, index, R1CS_HEADER, 'header')
+        header = _read_r1cs_header(f)
+
+        _seek_section(f, index, R1CS_CONSTRAINTS, 'constraint')
+        n8, num_constraints = header[0], header[-1]
+        for _ in range(num_constraints):
+            lcs = []
+            for _ in range(3):
+                nnz, = _read(f, '<I')
+                lc   = {}
+                for _ in range(nnz):
+                    wire, = _read(f, '<I')
+                    lc[wire] = _read_int(f, n8)
+
+                lcs.append(lc)
+
+            yield tuple(lcs)
+
+
+def read_r1cs(filepath: str, F: 'Field'=None) -> CircomR1CS:
+    """
+    Reads a circom `.r1cs` file. Wire 0 is the constant one, matching the `[1] + S` layout of
+    `R1CSConstraint`. `F` defaults to a `PrimeField` over the prime from the header.
+    """
+    with open(filepath, 'rb') as f:
+        index = _section_index(f, R1CS_MAGIC)
+        _seek_section(f, index, R1CS_HEADER, 'header')
+        header = _read_r1cs_header(f)
+
+        wire_to_label = None
+        if R1CS_WIRE2LABEL in index:
+            f.seek(index[R1CS_WIRE2LABEL])
+            wire_to_label = list(_read(f, f'<{header[2]}Q'))
+
+    n8, prime, num_wires, num_pub_out, num_pub_in, num_prv_in, num_labels, _ = header
+    F = F or PrimeField(prime)
+
+    constraints = []
+    for lcs in iter_r1cs_constraints(filepath):
+        dense = []
+        for lc in lcs:
+            values = [F(0)]*num_wires
+            for wire, coeff in lc.items():
+                values[wire] = F(coeff)
+
+            dense.append(values)
+
+        constraints.append(R1CSConstraint(*dense))
+
+    return CircomR1CS(F, num_wires, num_pub_out, num_pub_in, num_prv_in, num_labels, R1CSSystem(constraints), wire_to_label)
+
+
+def write_r1cs(filepath: str, r1cs: R1CSSystem, F: 'Field', num_pub_out: int=0, num_pub_in: int=0, num_prv_in: int=0, wire_to_label: list=None):
+    """
+    Writes `r1cs` as a circom `.r1cs` file. Public signals must come first in the assignment,
+    outputs before inputs, as circom expects.
+    """
+    prime     = int(F.characteristic())
+    n8        = field_size(prime)
+    num_wires = len(r1cs.constraints[0].ai) if r1cs.constraints else 1
+    labels    = wire_to_label or list(range(num_wires))
+
+    with open(filepath, 'wb') as f:
+        f.write(struct.pack('<4sII', R1CS_MAGIC, R1CS_VERSION, 3))
+
+        with _SectionWriter(f, R1CS_HEADER):
+            f.write(struct.pack('<I', n8))
+            f.write(prime.to_bytes(n8, 'little'))
+            f.write(struct.pack('<IIIIQI', num_wires, num_pub_out, num_pub_in, num_prv_in, max(labels)+1, len(r1cs.constraints)))
+
+        with _SectionWriter(f, R1CS_CONSTRAINTS):
+            for con in r1cs.constraints:
+                for vec in (con.ai, con.bi, con.ci):
+                    terms = [(wire, int(v) % prime) for wire, v in enumerate(vec) if int(v) % prime]
+                    f.write(struct.pack('<I', len(terms)))
+
+                    for wire, coeff in terms:
+                        f.write(struct.pack('<I', wire))
+                        f.write(coeff.to_bytes(n8, 'little'))
+
+        with _SectionWriter(f, R1CS_WIRE2LABEL):
+            f.write(struct.pack(f'<{num_wires}Q', *labels))
+
+
+
+def read_wtns(filepath: str, F: 'Field'=None) -> list:
+    """
+    Reads a circom `.wtns` file and returns the solution vector `S`, i.e. without the leading one.
+    """
+    with open(filepath, 'rb') as f:
+        index = _section_index(f, WTNS_MAGIC)
+        _seek_section(f, index, WTNS_HEADER, 'header')
+        n8,          = _read(f, '<I')
+        prime        = _read_int(f, n8)
+        num_witness, = _read(f, '<I')
+
+        _seek_section(f, index, WTNS_DATA, 'witness')
+        values = [_read_int(f, n8) for _ in range(num_witness)]
+
+    F = F or PrimeField(prime)
+    if values and values[0] != 1:
+        raise ValueError('Witness does not start with the constant one')
+
+    return [F(v) for v in values[1:]]
+
+
+def write_wtns(filepath: str, S: list, F: 'Field'):
+    prime = int(F.characteristic())
+    n8    = field_size(prime)
+
+    with open(filepath, 'wb') as f:
+        f.write(struct.pack('<4sII', WTNS_MAGIC, WTNS_VERSION, 2))
+
+        with _SectionWriter(f, WTNS_HEADER):
+            f.write(struct.pack('<I', n8))
+            f.write(prime.to_bytes(n8, 'little'))
+            f.write(struct.pack('<I', len(S)+1))
+
+        with _SectionWriter(f, WTNS_DATA):
+            for v in [1, *S]:
+                f.write((int(v) % prime).to_bytes(n8, 'little'))
@@ -0,0 +1,220 @@
+from samson.core.base_object import BaseObject
+from field import batch_inverse
+import dill
+
+
+# Jacobian points are `(X, Y, Z)` tuples of base field elements standing for the affine
+# point `(X/Z^2, Y/Z^3)`, with `Z == 0` the point at infinity. Adding and doubling them
+# needs no field inversion, so accumulators stay Jacobian and are normalized at the end.
+
+def to_jacobian(P: 'WeierstrassPoint') -> tuple:
+    K = P.curve.ring
+    if P == P.curve.zero:
+        return (K.one, K.one, K.zero)
+
+    return (P.x, P.y, K.one)
+
+
+def jacobian_double(P: tuple, a: 'FieldElement') -> tuple:
+    X, Y, Z = P
+    if not Z or not Y:
+        return (X, Y, Z*0)
+
+    XX   = X*X
+    YY   = Y*Y
+    YYYY = YY*YY
+    ZZ   = Z*Z
+    S    = X*YY*4
+    M    = XX*3 + a*ZZ*ZZ
+    X3   = M*M - S*2
+    Y3   = M*(S - X3) - YYYY*8
+    Z3   = Y*Z*2
+    return (X3, Y3, Z3)
+
+
+def jacobian_add(P: tuple, Q: tuple, a: 'FieldElement') -> tuple:
+    X1, Y1, Z1 = P
+    X2, Y2, Z2 = Q
+    if not Z1:
+        return Q
+
+    if not Z2:
+        return P
+
+    Z1Z1 = Z1*Z1
+    Z2Z2 = Z2*Z2
+    U1   = X1*Z2Z2
+    U2   = X2*Z1Z1
+    S1   = Y1*Z2*Z2Z2
+    S2   = Y2*Z1*Z1Z1
+    H    = U2 - U1
+    R    = S2 - S1
+
+    if not H:
+        if not R:
+            return jacobian_double(P, a)
+
+        return (X1, Y1, Z1*0)
+
+    HH  = H*H
+    HHH = H*HH
+    V   = U1*HH
+    X3  = R*R - HHH - V*2
+    Y3  = R*(V - X3) - S1*HHH
+    Z3  = Z1*Z2*H
+    return (X3, Y3, Z3)
+
+
+def jacobian_mul(P: tuple, scalar: int, a: 'FieldElement') -> tuple:
+    result = (P[0], P[1], P[2]*0)
+    for bit in bin(int(scalar))[2:]:
+        result = jacobian_double(result, a)
+        if bit == '1':
+            result = jacobian_add(result, P, a)
+
+    return result
+
+
+def batch_normalize(points: list, curve: 'WeierstrassCurve') -> list:
+    """
+    Converts Jacobian points to affine `WeierstrassPoint`s with a single field inversion.
+    """
+    finite = [i for i, P in enumerate(points) if P[2]]
+    invs   = batch_inverse([points[i][2] for i in finite])
+    result = [curve.zero]*len(points)
+
+    for i, z_inv in zip(finite, invs):
+        X, Y, _   = points[i]
+        zz_inv    = z_inv*z_inv
+        result[i] = curve(X*zz_inv, Y*zz_inv*z_inv, verify=False)
+
+    return result
+
+
+
+class FixedBaseTable(BaseObject):
+    """
+    Precomputed multiples of a fixed base point for windowed scalar multiplication.
+
+    `table[i][d]` holds `base * (d << (window*i))`, so multiplying by a scalar is one
+    lookup and one addition per window instead of a full double-and-add.
+    """
+
+    def __init__(self, base: 'WeierstrassPoint', order: int, window: int=4):
+        self.base   = base
+        self.order  = int(order)
+        self.window = window
+        self.table  = []
+
+        # Build in Jacobian coordinates, then normalize every entry with one inversion
+        a        = base.curve.a
+        rows     = []
+        row_base = to_jacobian(base)
+        for _ in range(-(-self.order.bit_length() // window)):
+            row = [row_base]
+            for _ in range(2, 1 << window):
+                row.append(jacobian_add(row[-1], row_base, a))
+
+            rows.append(row)
+
+            # (2^w - 1)*B + B = 2^w * B
+            row_base = jacobian_add(row[-1], row_base, a)
+
+        flat = batch_normalize([P for row in rows for P in row], base.curve)
+        size = (1 << window) - 1
+        for i in range(len(rows)):
+            self.table.append([base.ring.zero] + flat[i*size:(i+1)*size])
+
+
+    def __reprdir__(self):
+        return ['base', 'order', 'window']
+
+
+    @staticmethod
+    def optimal_window(order: int, num_scalars: int) -> int:
+        """
+        Picks the window minimizing `ceil(bits/w) * (2^w + num_scalars)` group additions.
+        """
+        bits = int(order).bit_length()
+        return min(range(1, 17), key=lambda w: -(-bits // w) * ((1 << w) + num_scalars))
+
+
+    @staticmethod
+    def load(filepath: str) -> 'FixedBaseTable':
+        with open(filepath, 'rb') as f:
+            return dill.load(f)
+
+
+    def _accumulate(self, scalar: int) -> tuple:
+        scalar = int(scalar) % self.order
+        mask   = (1 << self.window) - 1
+        a      = self.base.curve.a
+        result = to_jacobian(self.table[0][0])
+
+        for row in self.table:
+            if not scalar:
+                break
+
+            digit = scalar & mask
+            if digit:
+                result = jacobian_add(result, to_jacobian(row[digit]), a)
+
+            scalar >>= self.window
+
+        return result
+
+
+    def __mul__(self, scalar: int) -> 'WeierstrassPoint':
+        return batch_normalize([self._accumulate(scalar)], self.base.curve)[0]
+
+    __rmul__ = __mul__
+
+
+    def batch_mul(self, scalars: list) -> list:
+        return batch_normalize([self._accumulate(s) for s in scalars], self.base.curve)
+
+
+
+def msm(points: list, scalars: list, zero: 'WeierstrassPoint') -> 'WeierstrassPoint':
+    """
+    Multi-scalar multiplication `sum(P_i * s_i)` with Pippenger's bucket method in Jacobian
+    coordinates. Each `c`-bit window sorts points into buckets by digit, and the buckets are
+    combined with a running sum, so there is a single inversion at the very end.
+    """
+    pairs = [(to_jacobian(P), int(s)) for P, s in zip(points, scalars) if int(s)]
+    if not pairs:
+        return zero
+
+    a     = zero.curve.a
+    inf   = to_jacobian(zero)
+    bits  = max(s for _, s in pairs).bit_length()
+    c     = min(len(pairs).bit_length() // 2 + 1, 16)
+    total = inf
+
+    for shift in reversed(range(0, bits, c)):
+        for _ in range(c):
+            total = jacobian_double(total, a)
+
+        buckets = [inf]*((1 << c) - 1)
+        mask    = (1 << c) - 1
+        for P, s in pairs:
+            digit = (s >> shift) & mask
+            if digit:
+                buckets[digit-1] = jacobian_add(buckets[digit-1], P, a)
+
+        running, window_sum = inf, inf
+        for bucket in reversed(buckets):
+            running    = jacobian_add(running, bucket, a)
+            window_sum = jacobian_add(window_sum, running, a)
+
+        total = jacobian_add(total, window_sum, a)
+
+    return batch_normalize([total], zero.curve)[0]
+
+
+def split_msm(points: list, scalars: list, chunk_size: int) -> list:
+    """
+    Splits an MSM into `(points, scalars)` chunks whose partial sums add up to the full MSM.
+    """
+    scalars = list(scalars)
+    return [(points[i:i+chunk_size], scalars[i:i+chunk_size]) for i in range(0, len(scalars), chunk_size)]
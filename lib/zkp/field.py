@@ -0,0 +1,284 @@
+from samson.math.algebra.fields.field import Field, FieldElement
+from samson.math.algebra.rings.multiplicative_group import MultiplicativeGroup
+from samson.math.general import random_int, tonelli
+
+try:
+    from gmpy2 import mpz
+except ImportError:
+    mpz = int
+
+
+class PrimeFieldElement(FieldElement):
+    """
+    Element of a `PrimeField`. `val` is a plain int (an `mpz` with gmpy2) in `[0, p)`, and the
+    arithmetic operators work on it directly instead of going through samson's generic
+    ring dispatch and coercion.
+    """
+
+    def __init__(self, val: int, field: 'PrimeField'):
+        self.val         = val
+        self.ring        = field
+        self.field       = field
+        self.order_cache = None
+
+
+    def __reprdir__(self):
+        return ['val', 'ring']
+
+
+    def shorthand(self) -> str:
+        return f'{self.ring.shorthand()}({self.val})'
+
+
+    def tinyhand(self) -> str:
+        return str(self.val)
+
+
+    def get_ground(self) -> 'PrimeFieldElement':
+        return self
+
+
+    def ordinality(self) -> int:
+        return int(self.val)
+
+
+    def _coerce(self, other) -> int:
+        """
+        Returns `other` as an int, or None if it isn't an element of this field or an integer.
+        """
+        t = type(other)
+        if t is PrimeFieldElement:
+            if other.ring is not self.ring and other.ring != self.ring:
+                return None
+
+            return other.val
+
+        if t is int or t is mpz:
+            return other
+
+        if hasattr(other, 'ring') and not other.ring.is_superstructure_of(self.ring):
+            try:
+                return self.ring.coerce(other).val
+            except Exception:
+                return None
+
+        return None
+
+
+    def __add__(self, other):
+        v = self._coerce(other)
+        if v is None:
+            return super().__add__(other)
+
+        p = self.ring.p
+        return PrimeFieldElement((self.val + v) % p, self.ring)
+
+    __radd__ = __add__
+
+
+    def __sub__(self, other):
+        v = self._coerce(other)
+        if v is None:
+            return super().__sub__(other)
+
+        p = self.ring.p
+        return PrimeFieldElement((self.val - v) % p, self.ring)
+
+
+    def __rsub__(self, other):
+        v = self._coerce(other)
+        if v is None:
+            return super().__rsub__(other)
+
+        p = self.ring.p
+        return PrimeFieldElement((v - self.val) % p, self.ring)
+
+
+    def __mul__(self, other):
+        v = self._coerce(other)
+        if v is None:
+            return super().__mul__(other)
+
+        p = self.ring.p
+        return PrimeFieldElement((self.val * v) % p, self.ring)
+
+    __rmul__ = __mul__
+
+
+    def __neg__(self):
+        return PrimeFieldElement(-self.val % self.ring.p, self.ring)
+
+
+    def __invert__(self):
+        if not self.val:
+            raise ZeroDivisionError
+
+        return PrimeFieldElement(pow(self.val, -1, self.ring.p), self.ring)
+
+
+    def __truediv__(self, other):
+        v = self._coerce(other)
+        if v is None:
+            return super().__truediv__(other)
+
+        p = self.ring.p
+        if not v % p:
+            raise ZeroDivisionError
+
+        return PrimeFieldElement(self.val * pow(v, -1, p) % p, self.ring)
+
+    __floordiv__ = __truediv__
+
+
+    def __rtruediv__(self, other):
+        v = self._coerce(other)
+        if v is None:
+            return super().__rtruediv__(other)
+
+        if not self.val:
+            raise ZeroDivisionError
+
+        p = self.ring.p
+        return PrimeFieldElement(v * pow(self.val, -1, p) % p, self.ring)
+
+
+    def __pow__(self, exponent):
+        return PrimeFieldElement(pow(self.val, int(exponent), self.ring.p), self.ring)
+
+
+    def __mod__(self, other):
+        # Every nonzero element divides every other one in a field
+        return self.ring.zero
+
+
+    def __eq__(self, other) -> bool:
+        v = self._coerce(other)
+        if v is None:
+            return False
+
+        return self.val == v % self.ring.p
+
+
+    def __hash__(self) -> int:
+        return hash((self.ring, self.val))
+
+
+    def __bool__(self) -> bool:
+        return bool(self.val)
+
+
+    def __int__(self) -> int:
+        return int(self.val)
+
+    __index__ = __int__
+
+
+    def __lt__(self, other) -> bool:
+        return self.val < self._coerce(other)
+
+
+    def __gt__(self, other) -> bool:
+        return self.val > self._coerce(other)
+
+
+    def is_invertible(self) -> bool:
+        return bool(self.val)
+
+
+    def sqrt(self) -> 'PrimeFieldElement':
+        return self.ring(tonelli(int(self.val), self.ring.p))
+
+
+
+class PrimeFieldUnits(MultiplicativeGroup):
+    def order(self) -> int:
+        return self.ring.p - 1
+
+
+
+class PrimeField(Field):
+    """
+    Lightweight prime field `GF(p)`. It is a drop-in replacement for `ZZ/ZZ(p)` in the zkp
+    modules: it works with samson polynomial rings and groups, but its elements keep a plain
+    int and a cached modulus, so the `+`/`*` in constraint, QAP and proving loops are native
+    integer operations. Uses gmpy2 integers when available.
+    """
+
+    def __init__(self, p: int):
+        super().__init__()
+        self.p    = mpz(int(p))
+        self.zero = PrimeFieldElement(mpz(0), self)
+        self.one  = PrimeFieldElement(mpz(1), self)
+
+
+    def __reprdir__(self):
+        return ['p']
+
+
+    def __eq__(self, other) -> bool:
+        return type(other) is PrimeField and self.p == other.p
+
+
+    def __hash__(self) -> int:
+        return hash((PrimeField, int(self.p)))
+
+
+    def shorthand(self) -> str:
+        return f'GF({self.p})'
+
+
+    def characteristic(self) -> int:
+        return int(self.p)
+
+
+    def order(self) -> int:
+        return int(self.p)
+
+
+    def is_field(self) -> bool:
+        return True
+
+
+    def coerce(self, other) -> PrimeFieldElement:
+        if type(other) is PrimeFieldElement and other.ring == self:
+            return other
+
+        return PrimeFieldElement(mpz(int(other)) % self.p, self)
+
+
+    def __call__(self, other) -> PrimeFieldElement:
+        return self.coerce(other)
+
+
+    def element_at(self, x: int) -> PrimeFieldElement:
+        return self.coerce(x)
+
+
+    def random(self, size: object=None) -> PrimeFieldElement:
+        return self.coerce(random_int(int(size or self.p)))
+
+
+    def mul_group(self) -> PrimeFieldUnits:
+        return PrimeFieldUnits(self)
+
+
+def batch_inverse(elements: list) -> list:
+    """
+    Montgomery's trick: inverts every element with a single field inversion and
+    `3(n-1)` multiplications. Elements must be nonzero.
+    """
+    if not elements:
+        return []
+
+    prefix = [elements[0]]
+    for e in elements[1:]:
+        prefix.append(prefix[-1]*e)
+
+    inv    = ~prefix[-1]
+    result = [None]*len(elements)
+    for i in range(len(elements)-1, 0, -1):
+        result[i] = inv*prefix[i-1]
+        inv       = inv*elements[i]
+
+    result[0] = inv
+    return result
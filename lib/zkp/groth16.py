@@ -1,4 +1,18 @@
 from samson.core.base_object import BaseObject
+from samson.math.symbols import Symbol
+from concurrent.futures import Future, ProcessPoolExecutor
+from curve import FixedBaseTable, msm, split_msm
+from field import batch_inverse
+from pairing import G2Prepared, miller_loop, final_exponentiation, tate_pairing
+from profiling import profiled
+from qap import QAPSystem
+from serialization import FieldCodec, PointCodec, PolynomialCodec, SectionFile, write_sections, FLAG_COMPRESSED
+
+def _completed(fn, *args) -> Future:
+    future = Future()
+    future.set_result(fn(*args))
+    return future
+
 
 class Groth16Parameters(BaseObject):
     def __init__(self, G1, G2, g1, g2, Fr):
@@ -7,6 +21,36 @@ class Groth16Parameters(BaseObject):
         self.g1 = g1
         self.g2 = g2
         self.Fr = Fr
+        self._tables = {}
+
+
+    def __reprdir__(self):
+        return ['G1', 'G2', 'g1', 'g2', 'Fr']
+
+
+    def __eq__(self, other) -> bool:
+        # The table cache is derived, so it doesn't take part in equality
+        return type(other) is Groth16Parameters and (self.G1, self.G2, self.g1, self.g2, self.Fr) == (other.G1, other.G2, other.g1, other.g2, other.Fr)
+
+
+    def __hash__(self) -> int:
+        return hash((self.G1, self.G2, self.g1, self.g2, self.Fr))
+
+
+    def fixed_base_table(self, base: 'WeierstrassPoint', num_scalars: int=1) -> FixedBaseTable:
+        """
+        Returns a memoized fixed-base table for `base`. The table is only rebuilt
+        if `num_scalars` calls for a wider window than the cached one.
+        """
+        order  = self.Fr.characteristic()
+        window = FixedBaseTable.optimal_window(order, num_scalars)
+        table  = self._tables.get(base)
+
+        if not table or table.window < window:
+            table = FixedBaseTable(base, order, window)
+            self._tables[base] = table
+
+        return table
 
 
 class SimulationTrapdoor(BaseObject):
@@ -30,31 +74,217 @@ class SimulationTrapdoor(BaseObject):
 
 
 
+class VerifyingKey(BaseObject):
+    def __init__(self, g1_alpha, g2_beta, g2_gamma, g2_delta, g1_ic: list, params: 'Groth16Parameters'):
+        self.g1_alpha = g1_alpha
+        self.g2_beta  = g2_beta
+        self.g2_gamma = g2_gamma
+        self.g2_delta = g2_delta
+        self.g1_ic    = g1_ic
+        self.params   = params
+
+
+    def prepare(self) -> 'PreparedVerifyingKey':
+        return PreparedVerifyingKey(self)
+
+
+
+class PreparedVerifyingKey(BaseObject):
+    """
+    Caches everything in the verification equation that doesn't depend on the proof:
+    the target group value e(alpha, beta) and the Miller loop lines for gamma and delta.
+    """
+
+    def __init__(self, vk: VerifyingKey):
+        self.vk         = vk
+        self.r          = vk.params.Fr.characteristic()
+        self.alpha_beta = tate_pairing(vk.g1_alpha, vk.g2_beta, self.r)
+        self.g2_gamma   = G2Prepared(vk.g2_gamma, self.r)
+        self.g2_delta   = G2Prepared(vk.g2_delta, self.r)
+
+
+    def __reprdir__(self):
+        return ['vk']
+
+
+    def _g1_instance(self, I: list, one: int=1):
+        # Wire 0 is the constant one; a random linear combination of instances scales it too
+        return sum([g1_g*int(i) for g1_g, i in zip(self.vk.g1_ic, [one]+I)], self.vk.g1_alpha.ring.zero)
+
+
+    def _in_subgroup(self, proof: 'Groth16Proof') -> bool:
+        # Decoding only checks that points are on the curve; a B outside the r-torsion
+        # hits infinity partway through the Miller loop, so reject such proofs up front
+        return all(P*self.r == P.ring.zero for P in (proof.g1A, proof.g1C, proof.g2B))
+
+
+    @profiled('verify')
+    def verify(self, proof: 'Groth16Proof', I: list) -> bool:
+        if not self._in_subgroup(proof):
+            return False
+
+        g1_I = self._g1_instance(I)
+
+        # e(A,B)*e(-I,gamma)*e(-C,delta) == e(alpha,beta)
+        f = miller_loop(proof.g1A, proof.g2B, self.r) * miller_loop(-g1_I, self.g2_gamma, self.r) * miller_loop(-proof.g1C, self.g2_delta, self.r)
+        return final_exponentiation(f, self.r) == self.alpha_beta
+
+
+    def _batch_check(self, proofs: list, instances: list, z: list) -> bool:
+        if not all([self._in_subgroup(proof) for proof in proofs]):
+            return False
+
+        zero = self.vk.g1_alpha.ring.zero
+
+        # prod e(z_i*A_i, B_i) * e(-sum z_i*I_i, gamma) * e(-sum z_i*C_i, delta) == e(alpha,beta)^sum(z_i)
+        I_z  = [sum([int(zi)*int(i) for zi, i in zip(z, col)]) for col in zip(*instances)]
+        g1_I = self._g1_instance(I_z, sum([int(zi) for zi in z]))
+        g1_C = sum([proof.g1C*int(zi) for proof, zi in zip(proofs, z)], zero)
+
+        f = miller_loop(-g1_I, self.g2_gamma, self.r) * miller_loop(-g1_C, self.g2_delta, self.r)
+        for proof, zi in zip(proofs, z):
+            f *= miller_loop(proof.g1A*int(zi), proof.g2B, self.r)
+
+        return final_exponentiation(f, self.r) == self.alpha_beta ** (sum([int(zi) for zi in z]) % self.r)
+
+
+    @profiled('batch_verify')
+    def batch_verify(self, proofs: list, instances: list, z: list=None) -> list:
+        """
+        Verifies all `proofs` against their `instances` with one random linear combination
+        (N+2 Miller loops and a single final exponentiation). If the combined check fails,
+        the batch is bisected so each invalid proof is still reported. Returns one bool per proof.
+        """
+        if len(instances) != len(proofs) or (z and len(z) != len(proofs)):
+            raise ValueError(f"Got {len(proofs)} proofs, {len(instances)} instances and {len(z or proofs)} weights")
+
+        if len(proofs) < 2:
+            return [self.verify(proof, I) for proof, I in zip(proofs, instances)]
+
+        if not z:
+            Frm = self.vk.params.Fr.mul_group()
+            z   = [Frm.random().val for _ in proofs]
+
+        if self._batch_check(proofs, instances, z):
+            return [True]*len(proofs)
+
+        mid = len(proofs) // 2
+        return self.batch_verify(proofs[:mid], instances[:mid], z[:mid]) + self.batch_verify(proofs[mid:], instances[mid:], z[mid:])
+
+
+
 class CRS(BaseObject):
     def __init__(self, qap, CRS_G1, CRS_G2, params: 'Groth16Parameters'):
         self.qap    = qap
         self.CRS_G1 = CRS_G1
         self.CRS_G2 = CRS_G2
         self.params = params
+        self._pvk   = None
+        self._file  = None
+
+
+    def __reprdir__(self):
+        return ['qap', 'CRS_G1', 'CRS_G2', 'params']
 
 
     @staticmethod
+    @profiled('crs')
     def generate(qap: 'QAPSystem', params: Groth16Parameters, st: SimulationTrapdoor, num_instances: int) -> 'CRS':
-        g1, g2 = params.g1, params.g2
         n, m   = num_instances, len(qap.Ax)-num_instances-1
+        deg    = qap.T.degree()
+        g1     = params.fixed_base_table(params.g1, num_scalars=3 + 2*deg + n + m)
+        g2     = params.fixed_base_table(params.g2, num_scalars=3 + deg)
+
+        # Scalars only matter modulo the group order, so keep the powers of tau reduced
+        r        = params.Fr.characteristic()
+        tau_pows = [pow(st.tau, j, r) for j in range(deg)]
+        T_tau    = qap.T(st.tau)
+
+        # Invert gamma and delta once instead of dividing every term by them
+        gamma_inv, delta_inv = batch_inverse([params.Fr(st.gamma), params.Fr(st.delta)])
+        T_delta              = T_tau*delta_inv
 
         CRS_G1_0 = g1*st.alpha, g1*st.beta, g1*st.delta
-        CRS_G1_1 = [g1*(st.tau**j) for j in range(qap.T.degree())]
-        CRS_G1_2 = [g1*int((st.beta*qap.Ax[j](st.tau) + st.alpha*qap.Bx[j](st.tau) + qap.Cx[j](st.tau)) / st.gamma) for j in range(n+1)]
-        CRS_G1_3 = [g1*int((st.beta*qap.Ax[j+n](st.tau) + st.alpha*qap.Bx[j+n](st.tau) + qap.Cx[j+n](st.tau)) / st.delta) for j in range(1,m+1)]
-        CRS_G1_4 = [g1*int((st.tau**j * qap.T(st.tau)) / st.delta) for j in range(qap.T.degree()-1)]
+        CRS_G1_1 = g1.batch_mul(tau_pows)
+        CRS_G1_2 = g1.batch_mul([int((st.beta*qap.Ax[j](st.tau) + st.alpha*qap.Bx[j](st.tau) + qap.Cx[j](st.tau)) * gamma_inv) for j in range(n+1)])
+        CRS_G1_3 = g1.batch_mul([int((st.beta*qap.Ax[j+n](st.tau) + st.alpha*qap.Bx[j+n](st.tau) + qap.Cx[j+n](st.tau)) * delta_inv) for j in range(1,m+1)])
+        CRS_G1_4 = g1.batch_mul([int(tau_pows[j] * T_delta) for j in range(deg-1)])
 
         CRS_G1 = (CRS_G1_0, CRS_G1_1, CRS_G1_2, CRS_G1_3, CRS_G1_4)
-        CRS_G2 = g2*st.beta, g2*st.gamma, g2*st.delta, [g2*int(st.tau**j) for j in range(qap.T.degree())]
+        CRS_G2 = g2*st.beta, g2*st.gamma, g2*st.delta, g2.batch_mul(tau_pows)
 
         return CRS(qap, CRS_G1, CRS_G2, params)
 
 
+    def write(self, filepath: str, compressed: bool=True):
+        """
+        Writes the CRS and its QAP as fixed-width sections. See `CRS.read`.
+        """
+        g1   = PointCodec(self.params.g1.curve, compressed)
+        g2   = PointCodec(self.params.g2.curve, compressed)
+        poly = PolynomialCodec(self.qap.T.ring, self.qap.T.degree()+1)
+
+        write_sections(filepath, [
+            ('CRS_G1_0', g1, self.CRS_G1[0]),
+            ('CRS_G1_1', g1, self.CRS_G1[1]),
+            ('CRS_G1_2', g1, self.CRS_G1[2]),
+            ('CRS_G1_3', g1, self.CRS_G1[3]),
+            ('CRS_G1_4', g1, self.CRS_G1[4]),
+            ('CRS_G2',   g2, [*self.CRS_G2[:3], *self.CRS_G2[3]]),
+            ('QAP_T',    poly, [self.qap.T]),
+            ('QAP_A',    poly, self.qap.Ax),
+            ('QAP_B',    poly, self.qap.Bx),
+            ('QAP_C',    poly, self.qap.Cx)
+        ], FLAG_COMPRESSED if compressed else 0)
+
+
+    @staticmethod
+    def read(filepath: str, params: Groth16Parameters) -> 'CRS':
+        """
+        Memory-maps a CRS written by `CRS.write`. The verifying key is decoded up front;
+        the proving key sections and the QAP are decoded lazily on access, until `close`.
+        """
+        sf         = SectionFile(filepath)
+        compressed = bool(sf.flags & FLAG_COMPRESSED)
+        g1         = PointCodec(params.g1.curve, compressed)
+        g2         = PointCodec(params.g2.curve, compressed)
+        poly       = PolynomialCodec(params.Fr[Symbol('x')], sf.sections['QAP_T'][2] // FieldCodec(params.Fr).size)
+
+        CRS_G1 = (
+            tuple(sf.section('CRS_G1_0', g1)),
+            sf.section('CRS_G1_1', g1),
+            list(sf.section('CRS_G1_2', g1)),
+            sf.section('CRS_G1_3', g1),
+            sf.section('CRS_G1_4', g1)
+        )
+
+        CRS_G2 = (*sf.section('CRS_G2', g2)[:3], sf.section('CRS_G2', g2, start=3))
+        qap    = QAPSystem(sf.section('QAP_T', poly)[0], sf.section('QAP_A', poly), sf.section('QAP_B', poly), sf.section('QAP_C', poly))
+
+        crs       = CRS(qap, CRS_G1, CRS_G2, params)
+        crs._file = sf
+        return crs
+
+
+    def close(self):
+        """
+        Unmaps the file of a CRS from `CRS.read`. Its lazy sections can't be read afterwards.
+        """
+        if self._file:
+            self._file.close()
+
+
+    def verifying_key(self) -> VerifyingKey:
+        return VerifyingKey(self.CRS_G1[0][0], self.CRS_G2[0], self.CRS_G2[1], self.CRS_G2[2], self.CRS_G1[2], self.params)
+
+
+    def prepared_verifying_key(self) -> PreparedVerifyingKey:
+        if self._pvk is None:
+            self._pvk = self.verifying_key().prepare()
+
+        return self._pvk
+
+
     def _eval_tau(self, P, pot):
         return sum([g_tau_j*int(coeff) for coeff, g_tau_j in zip(P, pot)], pot[0].ring.zero)
 
@@ -77,7 +307,13 @@ class Groth16Proof(BaseObject):
 
 
     @staticmethod
-    def generate(crs: 'CRS', I: list, W: list, r: 'FieldElement'=None, t: 'FieldElement'=None) -> 'Groth16Proof':
+    @profiled('prove')
+    def generate(crs: 'CRS', I: list, W: list, r: 'FieldElement'=None, t: 'FieldElement'=None, processes: int=None, chunk_size: int=256) -> 'Groth16Proof':
+        """
+        If `processes` is given, the MSMs run on a process pool, each split into `chunk_size`
+        pieces whose partial sums are added here. H is computed here while they run, so workers
+        only ever receive plain points and scalars, never the QAP or a mapped CRS file.
+        """
         Frm = crs.params.Fr.mul_group()
         r   = r or Frm.random().val
         t   = t or Frm.random().val
@@ -88,32 +324,74 @@ class Groth16Proof(BaseObject):
 
         g2_beta  = crs.CRS_G2[0]
         g2_delta = crs.CRS_G2[2]
-        zero     = g1_alpha.ring.zero
-
-        g1W = sum([g1P*int(w) for g1P, w in zip(crs.CRS_G1[3], W)], zero)
-        g1A = g1_alpha + sum([crs.eval_g1_tau(A)*int(s) for A, s in zip(crs.qap.Ax, ([0]+I+W))], zero) + g1_delta*int(r)
-        g1B = g1_beta  + sum([crs.eval_g1_tau(B)*int(s) for B, s in zip(crs.qap.Bx, ([0]+I+W))], zero) + g1_delta*int(t)
-        g2B = g2_beta  + sum([crs.eval_g2_tau(B)*int(s) for B, s in zip(crs.qap.Bx, ([0]+I+W))], zero) + g2_delta*int(t)
-        g1C = g1W + crs.eval_gT_tau(crs.qap.H(I + W)) + g1A*int(t) + g1B*int(r) + g1_delta*int(-r*t)
+        g1_zero  = g1_alpha.ring.zero
+        g2_zero  = g2_beta.ring.zero
+
+        # Combine the QAP polynomials first so each term is a single MSM over the powers of tau
+        qap_eval = crs.qap.evaluate(I + W)
+        Ax       = qap_eval.A
+        Bx       = qap_eval.B
+
+        executor = ProcessPoolExecutor(processes) if processes else None
+        submit   = executor.submit if executor else _completed
+
+        try:
+            def fan_out(points, scalars, zero):
+                return [submit(msm, p, s, zero) for p, s in split_msm(points, scalars, chunk_size)]
+
+            g1W = fan_out(crs.CRS_G1[3], W, g1_zero)
+            g1A = fan_out(crs.CRS_G1[1], list(Ax), g1_zero)
+            g1B = fan_out(crs.CRS_G1[1], list(Bx), g1_zero)
+            g2B = fan_out(crs.CRS_G2[3], list(Bx), g2_zero)
+            g1H = fan_out(crs.CRS_G1[4], list(qap_eval.H), g1_zero)
+
+            g1W, g1A, g1B, g1H = [sum([f.result() for f in futures], g1_zero) for futures in (g1W, g1A, g1B, g1H)]
+            g2B                = sum([f.result() for f in g2B], g2_zero)
+        finally:
+            if executor:
+                executor.shutdown()
+
+        g1A = g1_alpha + g1A + g1_delta*int(r)
+        g1B = g1_beta  + g1B + g1_delta*int(t)
+        g2B = g2_beta  + g2B + g2_delta*int(t)
+        g1C = g1W + g1H + g1A*int(t) + g1B*int(r) + g1_delta*int(-r*t)
 
         return Groth16Proof(g1A, g1C, g2B, crs)
 
 
     def verify(self, I: list):
-        g1_alpha = self.crs.CRS_G1[0][0]
-        g1_beta  = self.crs.CRS_G1[0][1]
-        g1_delta = self.crs.CRS_G1[0][-1]
+        return self.crs.prepared_verifying_key().verify(self, I)
+
+
+    def to_bytes(self, compressed: bool=True) -> bytes:
+        g1 = PointCodec(self.crs.params.g1.curve, compressed)
+        g2 = PointCodec(self.crs.params.g2.curve, compressed)
+        return bytes([FLAG_COMPRESSED if compressed else 0]) + g1.encode(self.g1A) + g1.encode(self.g1C) + g2.encode(self.g2B)
+
 
-        g2_beta  = self.crs.CRS_G2[0]
-        g2_gamma = self.crs.CRS_G2[1]
-        g2_delta = self.crs.CRS_G2[2]
+    @staticmethod
+    def from_bytes(data: bytes, crs: 'CRS') -> 'Groth16Proof':
+        compressed = bool(data[0] & FLAG_COMPRESSED)
+        g1         = PointCodec(crs.params.g1.curve, compressed)
+        g2         = PointCodec(crs.params.g2.curve, compressed)
+        g1A_end    = 1 + g1.size
+        g1C_end    = g1A_end + g1.size
+
+        return Groth16Proof(g1.decode(data[1:g1A_end]), g1.decode(data[g1A_end:g1C_end]), g2.decode(data[g1C_end:]), crs)
 
-        def e(g1, g2):
-            return g1.weil_pairing(g2, g1.order())
 
-        g1_I = sum([g1_g*int(i) for g1_g, i in zip(self.crs.CRS_G1[2], [0]+I)], self.crs.params.G2.zero)
+    @staticmethod
+    def batch_verify(proofs: list, instances: list, z: list=None) -> list:
+        """
+        Verifies many proofs generated under the same CRS. See `PreparedVerifyingKey.batch_verify`.
+        """
+        if not proofs:
+            if instances:
+                raise ValueError(f"Got no proofs for {len(instances)} instances")
+
+            return []
 
-        return e(self.g1A, self.g2B) == e(g1_alpha, g2_beta) * e(g1_I, g2_gamma) * e(self.g1C, g2_delta)
+        return proofs[0].crs.prepared_verifying_key().batch_verify(proofs, instances, z)
 
 
     @staticmethod
@@ -125,7 +403,8 @@ class Groth16Proof(BaseObject):
         g1A = g1*int(A)
         g2B = g2*int(B)
 
-        I_prime = [1, *I]
-        g1C     = g1*int(A*B / st.delta) + g1*int(-st.alpha*st.beta / st.delta) + sum([g1*int(-(st.beta*crs.qap.Ax[j](st.tau) + st.alpha*crs.qap.Bx[j](st.tau) + crs.qap.Cx[j](st.tau)) / st.delta * I_prime[j]) for j in range(len(I_prime))], g1.ring.zero)
+        I_prime   = [1, *I]
+        delta_inv = ~crs.params.Fr(st.delta)
+        g1C       = g1*int(A*B * delta_inv) + g1*int(-st.alpha*st.beta * delta_inv) + sum([g1*int(-(st.beta*crs.qap.Ax[j](st.tau) + st.alpha*crs.qap.Bx[j](st.tau) + crs.qap.Cx[j](st.tau)) * delta_inv * I_prime[j]) for j in range(len(I_prime))], g1.ring.zero)
 
         return Groth16Proof(g1A, g1C, g2B, crs)
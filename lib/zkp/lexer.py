@@ -2,35 +2,96 @@ from samson.core.base_object import BaseObject
 from asg import Template, Component, Input, Output, ADD, MUL
 from algebraic_circuit import EdgeLabelSystem
 from qap import QAPSystem
+from cache import CompileCache
+from profiling import profiled
 from enum import Enum, auto
 import re
 import random
 
+# Bump whenever compilation output changes so stale cache entries are ignored
+COMPILER_VERSION = 1
+
 class Program(BaseObject):
-    def __init__(self, context):
+    def __init__(self, context, source: str=None):
         self.templates  = {k:v for k,v in context.items() if type(v) is Template}
         self.components = {k:v for k,v in context.items() if type(v) is Component}
-    
-    def build(self, F: 'Field'):
-        circuit = self.components['main'].build_circuit()
-        r1cs    = circuit.build_r1cs_system()
-        return circuit, QAPSystem.from_r1cs_system(F, r1cs)
-
-
-NAME_RE           = r'([a-zA-Z0-9_\.]+)'
-CALL_RE           = rf'{NAME_RE}[ ]*\(\)'
+        self.source     = source
+
+    def __reprdir__(self):
+        return ['templates', 'components']
+
+    @profiled('build')
+    def build(self, F: 'Field', cache: CompileCache=None):
+        """
+        Builds the circuit and its QAP. With a `cache`, the QAP of an unchanged source is
+        loaded instead of recompiled; the circuit is still built for execution.
+        """
+        main    = self.components['main']
+        circuit = main.build_circuit()
+
+        if cache is None or self.source is None:
+            r1cs = circuit.build_r1cs_system()
+            return circuit, QAPSystem.from_r1cs_system(F, r1cs)
+
+        key = CompileCache.key(self.source, F, COMPILER_VERSION)
+        circuit.finalize()
+        labels = [l.rep for l in main.els.labels]
+        cached = cache.load(key, F)
+
+        if cached and cached[0] == labels:
+            return circuit, cached[1]
+
+        r1cs = circuit.build_r1cs_system()
+        qap  = QAPSystem.from_r1cs_system(F, r1cs)
+        cache.store(key, F, labels, qap)
+        return circuit, qap
+
+
+TOKEN_RE = re.compile(r"""
+    (?P<SKIP>[ \t\r]+|//[^\n]*)
+    |(?P<NEWLINE>\n)
+    |(?P<NAME>[a-zA-Z0-9_\.]+)
+    |(?P<OP><==|===|[*+(){};=])
+""", re.VERBOSE)
+
+SEPARATORS = {'NEWLINE', ';'}
+
+
+def _syntax_error(message: str, source: str, line: int, column: int) -> SyntaxError:
+    """
+    A `SyntaxError` pointing at the 1-based `line` and `column` of `source`.
+    """
+    lines = source.splitlines()
+    text  = lines[line-1] if line <= len(lines) else ''
+    return SyntaxError(f"{message} at column {column}", (None, line, column, text))
+
+
+def tokenize(source: str):
+    """
+    Yields `(kind, value, line, column)` tokens in a single pass over `source`. Operators are
+    their own kind, and statements end at either a semicolon or a newline.
+    """
+    pos, line, line_start = 0, 1, 0
+    while pos < len(source):
+        column = pos - line_start + 1
+        match  = TOKEN_RE.match(source, pos)
+        if not match:
+            raise _syntax_error(f"Unexpected character {source[pos]!r}", source, line, column)
+
+        kind, value = match.lastgroup, match.group()
+        if kind == 'NEWLINE':
+            yield kind, value, line, column
+            line      += 1
+            line_start = match.end()
+        elif kind == 'OP':
+            yield value, value, line, column
+        elif kind != 'SKIP':
+            yield kind, value, line, column
+
+        pos = match.end()
+
+    yield 'EOF', '', line, pos - line_start + 1
 
-TEMPLATE_START_RE = re.compile(rf'template[ ]+{CALL_RE}')
-INPUT_RE          = re.compile(rf'signal input {NAME_RE}')
-OUTPUT_RE         = re.compile(rf'signal output {NAME_RE}')
-ASSIGN_RE         = re.compile(r'([a-zA-Z0-9\.]+)[ ]*<==[ ]*(.*)')
-CONSTRAIN_RE      = re.compile(r'([a-zA-Z0-9\.]+)[ ]*===[ ]*(.*)')
-COMPONENT_RE      = re.compile(rf'component {NAME_RE} = {CALL_RE}')
-MUL_RE            = re.compile(rf'{NAME_RE}[ ]*\*[ ]*{NAME_RE}')
-ADD_RE            = re.compile(rf'{NAME_RE}[ ]*\+[ ]*{NAME_RE}')
-VAR_RE            = re.compile(NAME_RE)
-
-ALL_RE = [TEMPLATE_START_RE, INPUT_RE, OUTPUT_RE, ASSIGN_RE, COMPONENT_RE, MUL_RE]
 
 class LexerState(Enum):
     ROOT         = auto()
@@ -68,35 +129,78 @@ class LexerFSM(BaseObject):
 
 
 class Lexer(BaseObject):
+    """
+    Recursive-descent parser over the token stream of `tokenize`.
+    """
+
     def __init__(self):
         self.fsm = LexerFSM()
 
 
-    def process_line(self, line: str, lines_left: 'List[str]', context: dict):
-        for r in ALL_RE:
-            match = r.match(line)
-            if match:
-                break
-
-        if r == TEMPLATE_START_RE:
-            return self.process_template(match, lines_left, context)
-        elif r == INPUT_RE:
-            return self.process_input(match, context), lines_left
-        elif r == OUTPUT_RE:
-            return self.process_output(match, context), lines_left
-        elif r == VAR_RE:
-            raise NotImplementedError
-        elif r == ASSIGN_RE:
-            return self.process_assign(match, context), lines_left
-        elif r == MUL_RE:
-            return self.process_mul(match, context), lines_left
-        elif r == COMPONENT_RE:
-            return self.process_component(match, context), lines_left
-
-
-    def process_input(self, match, context):
+    def __reprdir__(self):
+        return ['fsm']
+
+
+    def _advance(self):
+        self.token = next(self.tokens)
+
+
+    def _error(self, message: str, token: tuple=None) -> SyntaxError:
+        _, _, line, column = token or self.token
+        return _syntax_error(message, self.source, line, column)
+
+
+    def _expect(self, kind: str, value: str=None) -> str:
+        token_kind, token_value, _, _ = self.token
+        if token_kind != kind or (value is not None and token_value != value):
+            raise self._error(f"Expected {value or kind} but got {token_value or token_kind!r}")
+
+        self._advance()
+        return token_value
+
+
+    def _skip_separators(self):
+        while self.token[0] in SEPARATORS:
+            self._advance()
+
+
+    def _end_statement(self):
+        if self.token[0] not in SEPARATORS | {'}', 'EOF'}:
+            raise self._error(f"Expected end of statement but got {self.token[1]!r}")
+
+        self._skip_separators()
+
+
+    def process_statement(self, context: dict):
+        start       = self.token
+        kind, value = start[:2]
+
+        if value == 'template':
+            return self.process_template(context)
+        elif value == 'signal':
+            self._advance()
+            direction_token = self.token
+            direction       = self._expect('NAME')
+            if direction == 'input':
+                return self.process_input(self._expect('NAME'), context)
+            elif direction == 'output':
+                return self.process_output(self._expect('NAME'), context)
+
+            raise self._error(f"Unknown signal type {direction!r}", direction_token)
+
+        elif value == 'component':
+            return self.process_component(context)
+        elif kind == 'NAME':
+            self._advance()
+            if self.token[0] == '<==':
+                self.resolve_var(value, context, start)
+                return self.process_assign(value, context)
+
+        raise self._error("Unsupported statement", start)
+
+
+    def process_input(self, name, context):
         self.fsm.push(LexerState.IN_SIGNAL)
-        name = match.groups()[0]
         node = Input(name)
         self.fsm.pop()
 
@@ -105,9 +209,8 @@ class Lexer(BaseObject):
         return node
 
 
-    def process_output(self, match, context):
+    def process_output(self, name, context):
         self.fsm.push(LexerState.IN_SIGNAL)
-        name = match.groups()[0]
         node = Output(name)
         self.fsm.pop()
 
@@ -116,46 +219,87 @@ class Lexer(BaseObject):
         return node
 
 
-    def process_component(self, match, context):
+    def process_call(self) -> str:
+        name = self._expect('NAME')
+        self._expect('(')
+        self._expect(')')
+        return name
+
+
+    def process_component(self, context):
         self.fsm.push(LexerState.IN_COMPONENT)
-        name, com_type = match.groups()
-        node           = context[com_type].instantiate(name, context['parent'])
+        self._expect('NAME', 'component')
+        name = self._expect('NAME')
+        self._expect('=')
+        type_token = self.token
+        com_type   = self.process_call()
+        if type(context.get(com_type)) is not Template:
+            raise self._error(f"Unknown template {com_type!r}", type_token)
+
+        node = context[com_type].instantiate(name, context['parent'])
         self.fsm.pop()
 
         context[name] = node
         return node
 
 
-    def resolve_var(self, name, context):
-        # Handle component assignment
-        if '.' in name:
-            com_name, path = name.split('.', 1)
-            component = context[com_name]
-            return component.namespace[path]
-        else:
-            return context[name]
+    def resolve_var(self, name, context, token: tuple=None):
+        """
+        Looks up a signal or `component.signal`. Errors point at `token`, or the current token.
+        """
+        try:
+            # Handle component assignment
+            if '.' in name:
+                com_name, path = name.split('.', 1)
+                component = context[com_name]
+                return component.namespace[path]
+            else:
+                return context[name]
+        except (KeyError, AttributeError):
+            raise self._error(f"Undefined signal {name!r}", token) from None
 
 
-    def process_assign(self, match, context):
+    def _expect_var(self, context) -> str:
+        token = self.token
+        name  = self._expect('NAME')
+        self.resolve_var(name, context, token)
+        return name
+
+
+    def process_assign(self, lhs, context):
         self.fsm.push(LexerState.IN_ASSIGN)
+        self._expect('<==')
+        operand = self._expect_var(context)
+
+        if self.token[0] == '*':
+            self._advance()
+            rhs = self.process_mul(operand, self._expect_var(context), context)
+        elif self.token[0] == '+':
+            self._advance()
+            rhs = self.process_add(operand, self._expect_var(context), context)
+        else:
+            rhs = self.resolve_var(operand, context)
+
+        self.resolve_var(lhs, context).set(rhs)
+        self.fsm.pop()
 
-        lhs, rhs = match.groups()
-    
-        if MUL_RE.match(rhs):
-            mul_node = self.process_mul(MUL_RE.match(rhs), context)
-            self.resolve_var(lhs, context).set(mul_node)
 
-        elif VAR_RE.match(rhs):
-            v = VAR_RE.match(rhs).groups()[0]
-            self.resolve_var(lhs, context).set(self.resolve_var(v, context))
+    def process_mul(self, lhs, rhs, context):
+        self.fsm.push(LexerState.IN_OPERATOR)
+        node = MUL(f'm_{random.randbytes(4).hex()}')
+        context['parent'].add(node)
 
+        node.set(self.resolve_var(lhs, context))
+        node.set(self.resolve_var(rhs, context))
         self.fsm.pop()
 
+        context[node.name] = node
+        return node
 
-    def process_mul(self, match, context):
+
+    def process_add(self, lhs, rhs, context):
         self.fsm.push(LexerState.IN_OPERATOR)
-        lhs, rhs = match.groups()
-        node     = MUL(f'm_{random.randbytes(4).hex()}')
+        node = ADD(f'a_{random.randbytes(4).hex()}')
         context['parent'].add(node)
 
         node.set(self.resolve_var(lhs, context))
@@ -166,34 +310,50 @@ class Lexer(BaseObject):
         return node
 
 
-    def process_template(self, match, lines_left, context):
+    def process_template(self, context):
         self.fsm.push(LexerState.IN_TEMPLATE)
+        self._expect('NAME', 'template')
 
-        name         = match.groups()[0]
+        name         = self.process_call()
         node         = Template(name, context['els'])
         template_ctx = {'parent': node}
 
         template_ctx.update({k:v for k,v in context.items() if type(v) is (Template)})
 
-        for i,line in enumerate(lines_left):
-            if line == '}':
-                break
+        self._skip_separators()
+        self._expect('{')
+        self._skip_separators()
+
+        while self.token[0] != '}':
+            if self.token[0] == 'EOF':
+                raise self._error(f"Unterminated template {name}")
 
-            self.process_line(line, lines_left[i+1:], template_ctx)
+            self.process_statement(template_ctx)
+            self._end_statement()
 
+        self._advance()
         self.fsm.pop()
         context[name] = node
-        return node, lines_left[i+1:]
+        return node
 
 
+    @profiled('lex')
     def lex(self, source: str):
-        lines = [l.strip(' ;') for l in source.split('\n')]
-        lines = [l for l in lines if l]
+        self.source = source
+        self.tokens = tokenize(source)
+        self._advance()
 
         els          = EdgeLabelSystem()
         root_context = {'parent': None, 'els': els}
-        lines_left   = lines
-        while lines_left:
-            result, lines_left = self.process_line(lines_left[0], lines_left[1:], root_context)
 
-        return Program(root_context)
+        self._skip_separators()
+        while self.token[0] != 'EOF':
+            node = self.process_statement(root_context)
+
+            # Templates end with a closing brace rather than a separator
+            if type(node) is Template:
+                self._skip_separators()
+            else:
+                self._end_statement()
+
+        return Program(root_context, source)
@@ -0,0 +1,142 @@
+from samson.core.base_object import BaseObject
+
+def _is_zero(P: 'WeierstrassPoint') -> bool:
+    return P == P.ring.zero
+
+
+def _double_step(T: tuple, a: 'FieldElement'):
+    """
+    Returns the tangent line at `T` and `2T`. Lines are `(lam, c)` for `Y - lam*X - c`
+    or `(None, x0)` for the vertical `X - x0`. `None` is the point at infinity.
+    """
+    x, y = T
+    if not y:
+        return (None, x), None
+
+    lam = (x*x*3 + a) / (y*2)
+    x2  = lam*lam - x*2
+    return (lam, y - lam*x), (x2, lam*(x - x2) - y)
+
+
+def _add_step(T: tuple, Q: tuple, a: 'FieldElement'):
+    (xt, yt), (xq, yq) = T, Q
+    if xt == xq:
+        if yt == yq:
+            return _double_step(T, a)
+
+        return (None, xt), None
+
+    lam = (yq - yt) / (xq - xt)
+    x3  = lam*lam - xt - xq
+    return (lam, yt - lam*xt), (x3, lam*(xt - x3) - yt)
+
+
+def _eval_line(line: tuple, xp: 'FieldElement', yp: 'FieldElement'):
+    lam, c = line
+    if lam is None:
+        return xp - c
+
+    return yp - lam*xp - c
+
+
+def _miller_steps(Q: 'WeierstrassPoint', r: int):
+    """
+    Yields `(is_add, line, vertical_x)` for each Miller loop step over `Q`. These only
+    depend on `Q`, so they can be recorded once and replayed against many `P`.
+    """
+    if _is_zero(Q):
+        return
+
+    a     = Q.curve.a
+    Q_aff = (Q.x, Q.y)
+    T     = Q_aff
+
+    for bit in bin(int(r))[3:]:
+        line, T = _double_step(T, a)
+        yield False, line, T and T[0]
+
+        if bit == '1':
+            line, T = _add_step(T, Q_aff, a)
+            yield True, line, T and T[0]
+
+
+class G2Prepared(BaseObject):
+    """
+    Miller loop line coefficients for a fixed G2 point.
+    """
+
+    def __init__(self, Q: 'WeierstrassPoint', r: int):
+        self.Q     = Q
+        self.r     = int(r)
+        self.steps = list(_miller_steps(Q, r))
+
+
+    def __reprdir__(self):
+        return ['Q', 'r']
+
+
+
+def miller_loop(P: 'WeierstrassPoint', Q: 'WeierstrassPoint', r: int) -> 'FieldElement':
+    """
+    Computes `f_{r,Q}(P)` without the final exponentiation. `Q` may be a `G2Prepared`.
+    """
+    if type(Q) is G2Prepared:
+        steps = Q.steps
+        Q     = Q.Q
+    else:
+        steps = _miller_steps(Q, r)
+
+    K   = Q.curve.ring
+    num = K.one
+    den = K.one
+
+    if _is_zero(P):
+        return num
+
+    xp, yp = K(P.x), K(P.y)
+
+    for is_add, line, vertical_x in steps:
+        if not is_add:
+            num *= num
+            den *= den
+
+        num *= _eval_line(line, xp, yp)
+
+        if vertical_x is not None:
+            den *= xp - vertical_x
+
+    return num / den
+
+
+def final_exponentiation(f: 'FieldElement', r: int) -> 'FieldElement':
+    return f ** ((f.ring.order() - 1) // int(r))
+
+
+def tate_pairing(P: 'WeierstrassPoint', Q: 'WeierstrassPoint', r: int) -> 'FieldElement':
+    """
+    Reduced Tate pairing `e(P, Q) = f_{r,Q}(P)^((q^k - 1)/r)`. The Miller loop walks the
+    G2 argument and evaluates its lines at the G1 argument. Unlike the Weil pairing,
+    this is a single Miller loop and needs no point order computation.
+    """
+    return final_exponentiation(miller_loop(P, Q, r), r)
+
+
+def multi_pairing(pairs: list, r: int) -> 'FieldElement':
+    """
+    Computes `prod(e(P_i, Q_i))` as one product of Miller loops followed by a
+    single final exponentiation.
+    """
+    f = None
+    for P, Q in pairs:
+        f_i = miller_loop(P, Q, r)
+        f   = f_i if f is None else f*f_i
+
+    return final_exponentiation(f, r)
+
+
+def pairing_check(pairs: list, r: int) -> bool:
+    """
+    Returns whether `prod(e(P_i, Q_i)) == 1`.
+    """
+    result = multi_pairing(pairs, r)
+    return result == result.ring.one
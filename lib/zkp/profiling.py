@@ -0,0 +1,259 @@
+from samson.core.base_object import BaseObject
+from contextlib import contextmanager, nullcontext
+import functools
+import json
+import sys
+import time
+import tracemalloc
+
+# The running `Profiler`, if any. Hooks check this and do nothing else when it's None.
+_ACTIVE = None
+
+
+def profiled(name: str):
+    """
+    Marks a function as a pipeline stage. While a `Profiler` is running, calls are timed and
+    the operations they perform are attributed to `name`; otherwise the function runs as is.
+    """
+    def decorator(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            if _ACTIVE is None:
+                return fn(*args, **kwargs)
+
+            with _ACTIVE.stage(name):
+                return fn(*args, **kwargs)
+
+        return wrapper
+
+    return decorator
+
+
+def stage(name: str):
+    """
+    Context manager version of `profiled` for code that isn't a single function.
+    """
+    return _ACTIVE.stage(name) if _ACTIVE is not None else nullcontext()
+
+
+def _counted_operations() -> list:
+    """
+    `(owner, attribute, counter)` for every operation the profiler counts. Field operations are
+    only counted for `PrimeField` elements.
+    """
+    from samson.math.algebra.curves.weierstrass_curve import WeierstrassPoint
+    import curve
+    import field
+    import pairing
+
+    Fe = field.PrimeFieldElement
+    return [
+        (Fe, '__mul__', 'field_mul'),
+        (Fe, '__rmul__', 'field_mul'),
+        (Fe, '__invert__', 'field_inv'),
+        (Fe, '__truediv__', 'field_inv'),
+        (Fe, '__floordiv__', 'field_inv'),
+        (Fe, '__rtruediv__', 'field_inv'),
+        (WeierstrassPoint, '__add__', 'curve_add'),
+        (WeierstrassPoint, '__mul__', 'scalar_mul'),
+        (curve, 'jacobian_add', 'curve_add'),
+        (curve, 'jacobian_double', 'curve_double'),
+        (curve, 'jacobian_mul', 'scalar_mul'),
+        (curve.FixedBaseTable, '_accumulate', 'scalar_mul'),
+        (curve, 'msm', 'msm'),
+        (pairing, 'miller_loop', 'miller_loop'),
+        (pairing, 'final_exponentiation', 'final_exponentiation')
+    ]
+
+
+
+class StageStats(BaseObject):
+    def __init__(self, name: str):
+        self.name        = name
+        self.calls       = 0
+        self.time        = 0.0
+        self.peak_memory = 0
+        self.counts      = {}
+        self.children    = {}
+
+
+    def __reprdir__(self):
+        return ['name', 'calls', 'time', 'counts']
+
+
+    @property
+    def self_time(self) -> float:
+        return max(0.0, self.time - sum([child.time for child in self.children.values()]))
+
+
+    def child(self, name: str) -> 'StageStats':
+        if name not in self.children:
+            self.children[name] = StageStats(name)
+
+        return self.children[name]
+
+
+    def to_dict(self) -> dict:
+        return {
+            'name': self.name,
+            'calls': self.calls,
+            'time': self.time,
+            'self_time': self.self_time,
+            'peak_memory': self.peak_memory,
+            'counts': dict(self.counts),
+            'children': [child.to_dict() for child in self.children.values()]
+        }
+
+
+
+class Profiler(BaseObject):
+    """
+    Opt-in instrumentation for the compile and proving pipeline. Used as a context manager,
+    it times every `profiled` stage, tracks peak memory per stage if `memory` is set, and
+    counts field, curve and pairing operations per stage if `count_ops` is set.
+
+    Counting works by swapping wrappers in for the counted operations on entry and restoring
+    the originals on exit, so nothing is paid outside of a profiling run. Work done in
+    other processes, e.g. the prover's pool, is not seen.
+    """
+
+    def __init__(self, memory: bool=False, count_ops: bool=True):
+        self.memory    = memory
+        self.count_ops = count_ops
+        self.root      = StageStats('total')
+        self.totals    = {}
+        self._stack    = []
+        self._patches  = []
+
+
+    def __reprdir__(self):
+        return ['root', 'totals']
+
+
+    def __enter__(self):
+        global _ACTIVE
+        if _ACTIVE is not None:
+            raise RuntimeError("A profiler is already running")
+
+        _ACTIVE = self
+        if self.count_ops:
+            self._install_counters()
+
+        if self.memory:
+            self._started_tracing = not tracemalloc.is_tracing()
+            if self._started_tracing:
+                tracemalloc.start()
+
+        self._enter_stage(self.root)
+        return self
+
+
+    def __exit__(self, *args):
+        global _ACTIVE
+        self._exit_stage()
+
+        if self.memory and self._started_tracing:
+            tracemalloc.stop()
+
+        for owner, attr, original in reversed(self._patches):
+            setattr(owner, attr, original)
+
+        self._patches = []
+        _ACTIVE       = None
+
+
+    def _install_counters(self):
+        for owner, attr, key in _counted_operations():
+            original = getattr(owner, attr)
+            wrapper  = self._counting(original, key)
+
+            if isinstance(owner, type):
+                self._patches.append((owner, attr, original))
+                setattr(owner, attr, wrapper)
+            else:
+                # Patch every module that imported the function by name, not just its home
+                for module in list(sys.modules.values()):
+                    if getattr(module, '__dict__', {}).get(attr) is original:
+                        self._patches.append((module, attr, original))
+                        setattr(module, attr, wrapper)
+
+
+    def _counting(self, fn, key: str):
+        count = self.count
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            count(key)
+            return fn(*args, **kwargs)
+
+        return wrapper
+
+
+    def count(self, key: str, n: int=1):
+        counts           = self._stack[-1][0].counts
+        counts[key]      = counts.get(key, 0) + n
+        self.totals[key] = self.totals.get(key, 0) + n
+
+
+    def _enter_stage(self, node: StageStats):
+        if self.memory:
+            if self._stack:
+                parent = self._stack[-1][0]
+                parent.peak_memory = max(parent.peak_memory, tracemalloc.get_traced_memory()[1])
+
+            tracemalloc.reset_peak()
+
+        node.calls += 1
+        self._stack.append((node, time.perf_counter()))
+
+
+    def _exit_stage(self):
+        node, start = self._stack.pop()
+        node.time  += time.perf_counter() - start
+
+        if self.memory:
+            node.peak_memory = max(node.peak_memory, tracemalloc.get_traced_memory()[1])
+            tracemalloc.reset_peak()
+
+            if self._stack:
+                parent = self._stack[-1][0]
+                parent.peak_memory = max(parent.peak_memory, node.peak_memory)
+
+
+    @contextmanager
+    def stage(self, name: str):
+        self._enter_stage(self._stack[-1][0].child(name))
+        try:
+            yield
+        finally:
+            self._exit_stage()
+
+
+    def report(self) -> dict:
+        return {'stages': self.root.to_dict(), 'counts': dict(self.totals)}
+
+
+    def to_json(self, filepath: str=None) -> str:
+        data = json.dumps(self.report(), indent=2)
+        if filepath:
+            with open(filepath, 'w') as f:
+                f.write(data)
+
+        return data
+
+
+    def folded(self) -> str:
+        """
+        Stage self times in microseconds in the folded stack format read by flamegraph tools,
+        e.g. `total;prove;qap.evaluate 1234`.
+        """
+        lines = []
+
+        def walk(node, path):
+            path = path + [node.name]
+            lines.append(f"{';'.join(path)} {int(node.self_time*1e6)}")
+            for child in node.children.values():
+                walk(child, path)
+
+        walk(self.root, [])
+        return '\n'.join(lines)
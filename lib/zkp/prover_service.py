@@ -0,0 +1,175 @@
+from samson.core.base_object import BaseObject
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from groth16 import CRS, Groth16Proof
+import hashlib
+import queue
+import threading
+import time
+
+# Per-process state of the pool workers; filled in by `_init_worker`
+_WORKER = {}
+
+
+def _init_worker(params: 'Groth16Parameters', max_keys: int):
+    _WORKER['params']   = params
+    _WORKER['max_keys'] = max_keys
+    _WORKER['keys']     = OrderedDict()
+
+
+def _load_key(circuit_hash: str, filepath: str) -> CRS:
+    keys = _WORKER['keys']
+    if circuit_hash in keys:
+        keys.move_to_end(circuit_hash)
+    else:
+        keys[circuit_hash] = CRS.read(filepath, _WORKER['params'])
+
+        if len(keys) > _WORKER['max_keys']:
+            keys.popitem(last=False)[1].close()
+
+    return keys[circuit_hash]
+
+
+def _prove(circuit_hash: str, filepath: str, I: list, W: list, compressed: bool):
+    start  = time.perf_counter()
+    crs    = _load_key(circuit_hash, filepath)
+    loaded = time.perf_counter()
+    proof  = Groth16Proof.generate(crs, I, W)
+    proved = time.perf_counter()
+    data   = proof.to_bytes(compressed)
+    done   = time.perf_counter()
+
+    return data, {'load': loaded - start, 'prove': proved - loaded, 'serialize': done - proved}
+
+
+
+def hash_key_file(filepath: str) -> str:
+    h = hashlib.sha256()
+    with open(filepath, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            h.update(chunk)
+
+    return h.hexdigest()
+
+
+
+class ProofJob(BaseObject):
+    def __init__(self, job_id: int, circuit_hash: str, I: list, W: list):
+        self.job_id       = job_id
+        self.circuit_hash = circuit_hash
+        self.I            = I
+        self.W            = W
+        self.proof        = None
+        self.error        = None
+        self.timings      = {}
+        self.submitted_at = time.perf_counter()
+
+
+    def __reprdir__(self):
+        return ['job_id', 'circuit_hash', 'error', 'timings']
+
+
+
+class ProverService(BaseObject):
+    """
+    Long-lived prover for many witnesses over a few circuits. Proving keys are written with
+    `CRS.write` and registered by path; each pool worker keeps an LRU of up to `max_keys`
+    memory-mapped keys, so the decoded points of a circuit are reused across its jobs.
+    Jobs are queued with `submit` and serialized proofs are streamed back by `results`.
+    """
+
+    def __init__(self, params: 'Groth16Parameters', processes: int=None, max_keys: int=4, compressed: bool=True):
+        self.params     = params
+        self.compressed = compressed
+        self.keys       = {}
+        self.jobs       = queue.Queue()
+        self.done       = queue.Queue()
+        self.executor   = ProcessPoolExecutor(processes, initializer=_init_worker, initargs=(params, max_keys))
+
+        self._lock      = threading.Lock()
+        self._submitted = 0
+        self._closed    = False
+        self._thread    = threading.Thread(target=self._dispatch, daemon=True)
+        self._thread.start()
+
+
+    def __reprdir__(self):
+        return ['params', 'keys']
+
+
+    def register_key(self, filepath: str) -> str:
+        """
+        Registers a proving key file and returns its circuit hash.
+        """
+        circuit_hash = hash_key_file(filepath)
+        self.keys[circuit_hash] = filepath
+        return circuit_hash
+
+
+    def submit(self, circuit_hash: str, I: list, W: list) -> ProofJob:
+        if circuit_hash not in self.keys:
+            raise KeyError(circuit_hash)
+
+        # Checked and enqueued under the lock so no job can land behind the sentinel of `close`
+        with self._lock:
+            if self._closed:
+                raise RuntimeError("Service is closed")
+
+            job = ProofJob(self._submitted, circuit_hash, I, W)
+            self._submitted += 1
+            self.jobs.put(job)
+
+        return job
+
+
+    def _dispatch(self):
+        while True:
+            job = self.jobs.get()
+            if job is None:
+                break
+
+            future = self.executor.submit(_prove, job.circuit_hash, self.keys[job.circuit_hash], job.I, job.W, self.compressed)
+            future.add_done_callback(lambda f, job=job: self._finish(job, f))
+
+
+    def _finish(self, job: ProofJob, future):
+        try:
+            job.proof, job.timings = future.result()
+        except Exception as e:
+            job.error = e
+
+        job.timings['total'] = time.perf_counter() - job.submitted_at
+        self.done.put(job)
+
+
+    def close(self):
+        """
+        Stops accepting jobs. `results` finishes once every submitted job is done.
+        """
+        with self._lock:
+            if not self._closed:
+                self._closed = True
+                self.jobs.put(None)
+
+
+    def results(self):
+        """
+        Yields finished jobs in completion order until the service is closed and drained.
+        """
+        yielded = 0
+        while not (self._closed and yielded == self._submitted):
+            try:
+                job = self.done.get(timeout=0.1)
+            except queue.Empty:
+                continue
+
+            yielded += 1
+            yield job
+
+
+    def shutdown(self):
+        if not self._closed:
+            self.close()
+
+        self._thread.join()
+        self.executor.shutdown()
@@ -1,6 +1,97 @@
 from samson.core.base_object import BaseObject
 from samson.math.symbols import Symbol
 from samson.math.general import product
+from field import batch_inverse
+from profiling import profiled
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+
+def lagrange_basis(F: 'Field', m: list) -> list:
+    """
+    Coefficient lists (lowest degree first) of the Lagrange basis polynomials over the distinct
+    points `m`, i.e. `L_i(m_j) = [i == j]`. Every `L_i` is `T/(x - m_i)` scaled by the inverse
+    of its denominator `prod_{j != i} (m_i - m_j)`; the denominators are inverted together.
+    """
+    # T = prod (x - m_i)
+    T = [F.one]
+    for ml in m:
+        T = [F.zero] + T
+        for i in range(len(T)-1):
+            T[i] -= ml*T[i+1]
+
+    quotients = []
+    for ml in m:
+        # Synthetic division of T by (x - ml)
+        q     = [F.zero]*(len(T)-1)
+        carry = F.zero
+        for i in reversed(range(len(q))):
+            carry = T[i+1] + carry*ml
+            q[i]  = carry
+
+        quotients.append(q)
+
+    # q_i(m_i) is exactly the denominator of L_i
+    denominators = []
+    for q, ml in zip(quotients, m):
+        d = F.zero
+        for c in reversed(q):
+            d = d*ml + c
+
+        denominators.append(d)
+
+    return [[c*w for c in q] for q, w in zip(quotients, batch_inverse(denominators))]
+
+
+class QAPEvaluation(BaseObject):
+    """
+    `A(x)`, `B(x)` and `C(x)` of a QAP for one assignment `S`. `P = A*B - C` and its division by
+    `T` are computed on first use, so validity checks and the prover share the work.
+    """
+
+    def __init__(self, qap: 'QAPSystem', S: list, A: 'Polynomial', B: 'Polynomial', C: 'Polynomial'):
+        self.qap = qap
+        self.S   = S
+        self.A   = A
+        self.B   = B
+        self.C   = C
+        self._P  = None
+        self._H  = None
+        self._R  = None
+
+
+    def __reprdir__(self):
+        return ['qap', 'S']
+
+
+    @property
+    def P(self) -> 'Polynomial':
+        if self._P is None:
+            self._P = self.A*self.B - self.C
+
+        return self._P
+
+
+    @profiled('qap.divide')
+    def _divide(self):
+        if self._H is None:
+            self._H, self._R = divmod(self.P, self.qap.T)
+
+
+    @property
+    def H(self) -> 'Polynomial':
+        self._divide()
+        return self._H
+
+
+    def is_valid(self) -> bool:
+        self._divide()
+        return self._R == self.qap.T.ring.zero
+
+
 
 class QAPSystem(BaseObject):
     def __init__(self, T, Ax, Bx, Cx):
@@ -8,9 +99,24 @@ class QAPSystem(BaseObject):
         self.Ax = Ax
         self.Bx = Bx
         self.Cx = Cx
+        self._matrix = None
+
+
+    def __reprdir__(self):
+        return ['T', 'Ax', 'Bx', 'Cx']
+
+
+    def __eq__(self, other) -> bool:
+        # The cached coefficient matrix is derived, so it doesn't take part in equality
+        return type(other) is QAPSystem and (self.T, self.Ax, self.Bx, self.Cx) == (other.T, other.Ax, other.Bx, other.Cx)
+
+
+    def __hash__(self) -> int:
+        return hash((self.T, tuple(self.Ax), tuple(self.Bx), tuple(self.Cx)))
 
 
     @staticmethod
+    @profiled('qap')
     def from_r1cs_system(F: 'Field', r1cs: 'R1CSSystem', m: 'List[FieldElement]'=None):
         # Set up some vars
         k     = len(r1cs.constraints)
@@ -18,10 +124,22 @@ class QAPSystem(BaseObject):
         A,B,C = [[] for _ in range(nm)], [[] for _ in range(nm)], [[] for _ in range(nm)]
 
         Fm    = F.mul_group()
-        m     = m or [Fm.random().val for _ in range(1,k+1)]
         x     = Symbol('x')
         P     = F[x]
-        T     = product([(x-ml) for ml in m])
+
+        # Interpolation needs distinct points
+        if not m:
+            if k > Fm.order():
+                raise ValueError(f"{k} constraints need more distinct nonzero points than the field has")
+
+            m, seen = [], set()
+            while len(m) < k:
+                ml = Fm.random().val
+                if ml not in seen:
+                    seen.add(ml)
+                    m.append(ml)
+
+        T = product([(x-ml) for ml in m])
 
         # Sort constraints into their polynomials
         for constraint in r1cs.constraints:
@@ -35,20 +153,74 @@ class QAPSystem(BaseObject):
                 C[j].append(c)
 
 
-        Ax, Bx, Cx = [[P.interpolate(list(zip(m, Xj))) for Xj in X] for X in (A, B, C)]
+        # Every column interpolates over the same points, so share one Lagrange basis
+        basis = lagrange_basis(F, m)
+
+        def interpolate(Xj):
+            coeffs = [F.zero]*k
+            for L, y in zip(basis, Xj):
+                if y:
+                    for i, c in enumerate(L):
+                        coeffs[i] += c*y
+
+            return P(coeffs)
+
+        Ax, Bx, Cx = [[interpolate(Xj) for Xj in X] for X in (A, B, C)]
         return QAPSystem(T, Ax, Bx, Cx)
 
 
-    def P(self, S):
-        A = sum([a*v for a,v in zip(self.Ax, [1] + S)])
-        B = sum([b*v for b,v in zip(self.Bx, [1] + S)])
-        C = sum([c*v for c,v in zip(self.Cx, [1] + S)])
+    def coefficient_matrix(self):
+        """
+        The coefficients of `Ax`, `Bx` and `Cx` stacked into one matrix as ints, one row per
+        polynomial and one column per power of `x`. Built once and cached.
+        """
+        if self._matrix is None:
+            k    = self.T.degree()
+            rows = []
+            for poly in (*self.Ax, *self.Bx, *self.Cx):
+                row = [int(c) for c in list(poly)[:k]]
+                rows.append(row + [0]*(k-len(row)))
+
+            self._matrix = np.array(rows, dtype=object) if np is not None else rows
+
+        return self._matrix
+
+
+    @profiled('qap.evaluate')
+    def evaluate(self, S: list) -> QAPEvaluation:
+        """
+        Evaluates the QAP for the assignment `S`. `A`, `B` and `C` come from one product of the
+        stacked coefficient matrix with `[1] + S`, reduced modulo `p` at the end.
+        """
+        matrix = self.coefficient_matrix()
+        ring   = self.T.ring
+        p      = int(ring.ring.characteristic())
+        nm     = len(self.Ax)
+        values = [1] + [int(v) for v in S]
 
-        return (A * B - C)
+        polys = []
+        for i in range(3):
+            rows = matrix[i*nm:(i+1)*nm]
+            if np is not None:
+                coeffs = np.array(values, dtype=object).dot(rows) if len(rows[0]) else []
+            else:
+                coeffs = [0]*self.T.degree()
+                for v, row in zip(values, rows):
+                    if v:
+                        for j, c in enumerate(row):
+                            coeffs[j] += c*v
+
+            polys.append(ring([int(c) % p for c in coeffs]))
+
+        return QAPEvaluation(self, S, *polys)
+
+
+    def P(self, S):
+        return self.evaluate(S).P
 
 
     def H(self, S):
-        return self.P(S) // self.T
+        return self.evaluate(S).H
 
     def is_valid_assignment(self, S: list):
-        return self.P(S) % self.T == self.T.ring(0)
+        return self.evaluate(S).is_valid()
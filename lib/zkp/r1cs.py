@@ -8,6 +8,119 @@ class R1CSSystem(BaseObject):
         return all(con.is_valid_assignment(S) for con in self.constraints)
 
 
+    def optimize(self, F: 'Field', num_instances: int=0) -> 'R1CSOptimization':
+        """
+        Substitutes linear constraints into the remaining ones, drops trivial and duplicate
+        rows, and renumbers the surviving signals. The first `num_instances` signals are
+        public and never eliminated.
+        """
+        num_signals = len(self.constraints[0].ai) - 1 if self.constraints else 0
+        rows        = [[{j: F(v) for j, v in enumerate(vec) if v} for vec in (con.ai, con.bi, con.ci)] for con in self.constraints]
+
+        # Which rows each signal occurs in
+        occurrences = {}
+        for idx, row in enumerate(rows):
+            for vec in row:
+                for j in vec:
+                    occurrences.setdefault(j, set()).add(idx)
+
+        def linear_form(row):
+            a, b, c = row
+            if not a or not b:
+                return {j: -v for j, v in c.items()}
+
+            for const, other in ((a, b), (b, a)):
+                if set(const) == {0}:
+                    form = {j: const[0]*v for j, v in other.items()}
+                    for j, v in c.items():
+                        form[j] = form.get(j, F(0)) - v
+
+                    return {j: v for j, v in form.items() if v}
+
+            return None
+
+
+        substitutions = []
+        alive         = [True]*len(rows)
+        worklist      = list(range(len(rows)))
+
+        while worklist:
+            idx = worklist.pop()
+            if not alive[idx]:
+                continue
+
+            form = linear_form(rows[idx])
+            if form is None:
+                continue
+
+            if not form:
+                alive[idx] = False
+                continue
+
+            candidates = [j for j in form if j > num_instances]
+            if not candidates:
+                continue
+
+            # Eliminate the signal with the fewest occurrences to limit fill-in
+            k     = min(candidates, key=lambda j: len(occurrences[j]))
+            inv   = ~form[k]
+            subst = {j: -v*inv for j, v in form.items() if j != k}
+            substitutions.append((k, subst))
+            alive[idx] = False
+
+            for other in occurrences.pop(k):
+                if other == idx or not alive[other]:
+                    continue
+
+                for vec in rows[other]:
+                    coeff = vec.pop(k, None)
+                    if coeff is None:
+                        continue
+
+                    for j, v in subst.items():
+                        vec[j] = vec.get(j, F(0)) + coeff*v
+                        if not vec[j]:
+                            del vec[j]
+                        else:
+                            occurrences.setdefault(j, set()).add(other)
+
+                worklist.append(other)
+
+
+        eliminated = {k for k, _ in substitutions}
+        signals    = [j for j in range(1, num_signals+1) if j not in eliminated]
+        renumber   = {0: 0, **{j: i+1 for i, j in enumerate(signals)}}
+        width      = len(signals)+1
+
+        constraints = []
+        seen        = set()
+        for idx, row in enumerate(rows):
+            if not alive[idx]:
+                continue
+
+            a, b, c = row
+            if (not a or not b) and not c:
+                continue
+
+            key = tuple(tuple(sorted((j, int(v)) for j, v in vec.items())) for vec in row)
+            if key in seen or (key[1], key[0], key[2]) in seen:
+                continue
+
+            seen.add(key)
+
+            dense = []
+            for vec in row:
+                values = [F(0)]*width
+                for j, v in vec.items():
+                    values[renumber[j]] = v
+
+                dense.append(values)
+
+            constraints.append(R1CSConstraint(*dense))
+
+        return R1CSOptimization(R1CSSystem(constraints), [j-1 for j in signals], substitutions, num_signals, F)
+
+
 class R1CSConstraint(BaseObject):
     def __init__(self, ai, bi, ci):
         self.ai = ai
@@ -20,3 +133,41 @@ class R1CSConstraint(BaseObject):
         C = sum([c*v for c,v in zip(self.ci, [1] + S)])
 
         return A * B == C
+
+class R1CSOptimization(BaseObject):
+    """
+    Result of `R1CSSystem.optimize`. `signals[i]` is the index in the original assignment
+    of the optimized system's `i`-th signal.
+    """
+
+    def __init__(self, system: R1CSSystem, signals: list, substitutions: list, num_signals: int, F: 'Field'):
+        self.system        = system
+        self.signals       = signals
+        self.substitutions = substitutions
+        self.num_signals   = num_signals
+        self.F             = F
+
+
+    def __reprdir__(self):
+        return ['system', 'signals']
+
+
+    def reduce(self, S: list) -> list:
+        """
+        Projects an assignment of the original system onto the optimized one.
+        """
+        return [S[i] for i in self.signals]
+
+
+    def expand(self, S: list) -> list:
+        """
+        Recovers the original assignment from one of the optimized system.
+        """
+        z = [self.F(1)] + [None]*self.num_signals
+        for i, v in zip(self.signals, S):
+            z[i+1] = v
+
+        for k, subst in reversed(self.substitutions):
+            z[k] = sum([v*z[j] for j, v in subst.items()], self.F(0))
+
+        return z[1:]
@@ -0,0 +1,266 @@
+from samson.core.base_object import BaseObject
+import mmap
+import struct
+
+MAGIC      = b'G16\x00'
+VERSION    = 1
+LIMB_SIZE  = 8
+
+HEADER     = struct.Struct('<4sIII')
+SECTION    = struct.Struct('<16sQQI')
+
+FLAG_COMPRESSED = 1
+
+POINT_INFINITY  = 1
+POINT_Y_SIGN    = 2
+
+
+class FieldCodec(BaseObject):
+    """
+    Encodes (extension) field elements as one fixed-width, little-endian run of
+    64-bit limbs per coefficient.
+    """
+
+    def __init__(self, field: 'Field'):
+        self.field  = field
+        self.degree = getattr(field, 'n', 1)
+        self.width  = -(-int(field.characteristic()).bit_length() // (LIMB_SIZE*8)) * LIMB_SIZE
+        self.size   = self.degree * self.width
+
+
+    def __reprdir__(self):
+        return ['field', 'size']
+
+
+    def coefficients(self, e: 'FieldElement') -> list:
+        if self.degree == 1:
+            return [int(e)]
+
+        coeffs = [int(c) for c in e.val.val]
+        return coeffs + [0]*(self.degree - len(coeffs))
+
+
+    def encode(self, e: 'FieldElement') -> bytes:
+        return b''.join([c.to_bytes(self.width, 'little') for c in self.coefficients(e)])
+
+
+    def decode(self, data: bytes) -> 'FieldElement':
+        coeffs = [int.from_bytes(data[i:i+self.width], 'little') for i in range(0, self.size, self.width)]
+        if self.degree == 1:
+            return self.field(coeffs[0])
+
+        return self.field(self.field.reducing_poly.ring(coeffs))
+
+
+
+class PointCodec(BaseObject):
+    """
+    Encodes curve points as a flag byte followed by affine `x`, and `y` unless compressed.
+    Compressed points keep only the "sign" of `y`, i.e. whether it is the larger of `y`
+    and `-y` when their coefficients are compared from the top.
+    """
+
+    def __init__(self, curve: 'WeierstrassCurve', compressed: bool=True):
+        self.curve      = curve
+        self.compressed = compressed
+        self.field      = FieldCodec(curve.ring)
+        self.size       = 1 + self.field.size*(1 if compressed else 2)
+
+
+    def __reprdir__(self):
+        return ['curve', 'compressed', 'size']
+
+
+    def _y_sign(self, y: 'FieldElement') -> bool:
+        return self.field.coefficients(y)[::-1] > self.field.coefficients(-y)[::-1]
+
+
+    def encode(self, P: 'WeierstrassPoint') -> bytes:
+        if P == self.curve.zero:
+            return bytes([POINT_INFINITY]) + bytes(self.size-1)
+
+        flags = POINT_Y_SIGN if self._y_sign(P.y) else 0
+        data  = self.field.encode(P.x)
+
+        if not self.compressed:
+            data += self.field.encode(P.y)
+
+        return bytes([flags]) + data
+
+
+    def decode(self, data: bytes) -> 'WeierstrassPoint':
+        flags = data[0]
+        if flags & POINT_INFINITY:
+            return self.curve.zero
+
+        x = self.field.decode(data[1:1+self.field.size])
+
+        if self.compressed:
+            y = (x**3 + self.curve.a*x + self.curve.b).sqrt()
+            if self._y_sign(y) != bool(flags & POINT_Y_SIGN):
+                y = -y
+        else:
+            y = self.field.decode(data[1+self.field.size:])
+
+        return self.curve(x, y)
+
+
+
+class PolynomialCodec(BaseObject):
+    """
+    Encodes polynomials of degree below `length` as dense coefficient vectors.
+    """
+
+    def __init__(self, poly_ring: 'PolynomialRing', length: int):
+        self.poly_ring = poly_ring
+        self.length    = length
+        self.field     = FieldCodec(poly_ring.ring)
+        self.size      = self.field.size*length
+
+
+    def __reprdir__(self):
+        return ['poly_ring', 'length']
+
+
+    def encode(self, poly: 'Polynomial') -> bytes:
+        coeffs = list(poly)
+        coeffs = coeffs + [0]*(self.length - len(coeffs))
+        return b''.join([self.field.encode(self.poly_ring.ring(c)) for c in coeffs])
+
+
+    def decode(self, data: bytes) -> 'Polynomial':
+        size = self.field.size
+        return self.poly_ring([self.field.decode(data[i:i+size]) for i in range(0, self.size, size)])
+
+
+
+def write_header(f, sections: list, flags: int=0):
+    """
+    Writes the header and section table for `(name, count, item_size)` entries. The section
+    data must follow in the same order; this lets large sections be streamed in chunks.
+    """
+    offset = HEADER.size + SECTION.size*len(sections)
+    table  = []
+
+    for name, count, item_size in sections:
+        table.append(SECTION.pack(name.encode(), offset, count, item_size))
+        offset += count*item_size
+
+    f.write(HEADER.pack(MAGIC, VERSION, flags, len(sections)))
+    f.write(b''.join(table))
+
+
+def write_sections(filepath: str, sections: list, flags: int=0):
+    """
+    Writes `(name, codec, items)` sections behind a header and a section table of
+    `(name, offset, count, item_size)` entries.
+    """
+    with open(filepath, 'wb') as f:
+        write_header(f, [(name, len(items), codec.size) for name, codec, items in sections], flags)
+
+        for _, codec, items in sections:
+            for item in items:
+                f.write(codec.encode(item))
+
+
+
+class SectionFile(BaseObject):
+    """
+    Memory-maps a file written by `write_sections`. Sections are only decoded when
+    their items are accessed. The map stays open until `close`, or the end of a `with` block.
+    """
+
+    def __init__(self, filepath: str):
+        self.filepath = filepath
+
+        with open(filepath, 'rb') as f:
+            self.mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        magic, version, self.flags, num_sections = HEADER.unpack_from(self.mm, 0)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError(f'{filepath} is not a version {VERSION} section file')
+
+        self.sections = {}
+        for i in range(num_sections):
+            name, offset, count, item_size = SECTION.unpack_from(self.mm, HEADER.size + SECTION.size*i)
+            self.sections[name.rstrip(b'\x00').decode()] = (offset, count, item_size)
+
+
+    def __reprdir__(self):
+        return ['filepath', 'flags']
+
+
+    def __enter__(self):
+        return self
+
+
+    def __exit__(self, *args):
+        self.close()
+
+
+    def close(self):
+        """
+        Unmaps the file. Sections taken from it can't be read afterwards.
+        """
+        self.mm.close()
+
+
+    def raw(self, name: str, start: int, count: int) -> bytes:
+        """
+        Returns the encoded bytes of items `[start, start+count)` of a section.
+        """
+        offset, total, item_size = self.sections[name]
+        count = max(0, min(count, total - start))
+        return self.mm[offset + start*item_size:offset + (start+count)*item_size]
+
+
+    def section(self, name: str, codec: BaseObject, start: int=0) -> 'LazySection':
+        offset, count, item_size = self.sections[name]
+        if item_size != codec.size:
+            raise ValueError(f'Section {name} has {item_size}-byte items; expected {codec.size}')
+
+        return LazySection(self.mm, offset + start*item_size, count - start, codec)
+
+
+
+class LazySection(BaseObject):
+    """
+    Read-only sequence over a memory-mapped section. Items are decoded on first access.
+    """
+
+    def __init__(self, mm: mmap.mmap, offset: int, count: int, codec: BaseObject):
+        self.mm      = mm
+        self.offset  = offset
+        self.count   = count
+        self.codec   = codec
+        self.decoded = [None]*count
+
+
+    def __reprdir__(self):
+        return ['count', 'codec']
+
+
+    def __len__(self):
+        return self.count
+
+
+    def __getitem__(self, idx):
+        if type(idx) is slice:
+            return [self[i] for i in range(*idx.indices(self.count))]
+
+        if idx < 0:
+            idx += self.count
+
+        if not 0 <= idx < self.count:
+            raise IndexError(idx)
+
+        if self.decoded[idx] is None:
+            start = self.offset + idx*self.codec.size
+            self.decoded[idx] = self.codec.decode(self.mm[start:start+self.codec.size])
+
+        return self.decoded[idx]
+
+
+    def __iter__(self):
+        for i in range(self.count):
+            yield self[i]
@@ -1,11 +1,25 @@
 from unittest import TestCase
 from samson.all import *
-from algebraic_circuit import MultiplicationGate, EdgeLabelSystem, Source, Sink, Label, AlgebraicCircuit
+from tempfile import TemporaryDirectory
+import json
+import os
+import threading
+import benchmark
+from algebraic_circuit import MultiplicationGate, AdditionGate, EdgeLabelSystem, Source, Sink, Label, AlgebraicCircuit
+from cache import CompileCache
+from ceremony import PowersOfTau, TauContribution
 from asg import Template, Component, Input, Output, ADD, MUL
+from circom import read_r1cs, write_r1cs, read_wtns, write_wtns, iter_r1cs_constraints
+from curve import FixedBaseTable, msm
+from field import PrimeField, batch_inverse
+from pairing import tate_pairing, multi_pairing
 from groth16 import Groth16Proof, CRS, Groth16Parameters, SimulationTrapdoor
-from lexer import Lexer
-from qap import QAPSystem
+from profiling import Profiler
+from prover_service import ProverService
+from lexer import Lexer, COMPILER_VERSION
+from qap import QAPSystem, lagrange_basis
 from r1cs import R1CSSystem, R1CSConstraint
+from serialization import SectionFile
 
 
 SOURCE_3FAC = """
@@ -34,6 +48,52 @@ component main = three_fac()
 """
 
 
+def r1cs_3fac(Fr):
+    """
+    The 3fac circuit with wires (1, x4, x1, x2, x3, x1*x2).
+    """
+    return R1CSSystem([
+        R1CSConstraint(
+            [Fr(0), Fr(0), Fr(1), Fr(0), Fr(0), Fr(0)],
+            [Fr(0), Fr(0), Fr(0), Fr(1), Fr(0), Fr(0)],
+            [Fr(0), Fr(0), Fr(0), Fr(0), Fr(0), Fr(1)]
+        ),
+        R1CSConstraint(
+            [Fr(0), Fr(0), Fr(0), Fr(0), Fr(0), Fr(1)],
+            [Fr(0), Fr(0), Fr(0), Fr(0), Fr(1), Fr(0)],
+            [Fr(0), Fr(1), Fr(0), Fr(0), Fr(0), Fr(0)]
+        )
+    ])
+
+
+def f43_6_params(Fr):
+    """
+    Groth16 parameters with G1 = G2 = E: y^2 = x^3 + 6 over F43^6 and generators of order 13.
+    Returns the parameters and the generator `y` of F43^6.
+    """
+    F     = ZZ/ZZ(43)
+    y     = Symbol('y')
+    P     = F[y]
+    F43_6 = FF(43, 6, reducing_poly=y**6 + 6)
+
+    E6 = EllipticCurve(F43_6(0), F43_6(6))
+    g1 = E6(13, 15)
+    g2 = E6(7*y**2, 16*y**3)
+
+    return Groth16Parameters(G1=E6, G2=E6, g1=g1, g2=g2, Fr=Fr), y
+
+
+def f43_6_crs(Fr, system, num_instances: int=1):
+    """
+    CRS for `system` over `f43_6_params` with the fixed trapdoor of the 3fac examples.
+    """
+    qap       = QAPSystem.from_r1cs_system(Fr, system, m=(Fr(5), Fr(7)))
+    st        = SimulationTrapdoor(Fr(6), Fr(5), Fr(4), Fr(3), Fr(2))
+    params, y = f43_6_params(Fr)
+
+    return CRS.generate(qap, params, st, num_instances=num_instances), y
+
+
 class Web3TestCases(TestCase):
     def test_3fac_r1cs(self):
         # Test example
@@ -80,6 +140,19 @@ class Web3TestCases(TestCase):
         qap = QAPSystem.from_r1cs_system(F, r1cs)
         self.assertTrue(qap.is_valid_assignment(I + W))
 
+        # The stacked matrix product matches summing the polynomials directly
+        ev = qap.evaluate(I + W)
+        for X, poly in ((qap.Ax, ev.A), (qap.Bx, ev.B), (qap.Cx, ev.C)):
+            self.assertEqual(poly, sum([p*v for p, v in zip(X, [1] + I + W)]))
+
+        self.assertEqual(ev.H*qap.T, ev.P)
+        self.assertFalse(qap.is_valid_assignment(I + W[:-1] + [W[-1]+1]))
+
+        # Only 12 nonzero points to interpolate over
+        trivial = R1CSConstraint([F(0)]*2, [F(0)]*2, [F(0)]*2)
+        with self.assertRaises(ValueError):
+            QAPSystem.from_r1cs_system(F, R1CSSystem([trivial]*13))
+
 
     def test_circuit(self):
         F   = ZZ/ZZ(13)
@@ -105,6 +178,10 @@ class Web3TestCases(TestCase):
 
         r1cs = circuit.build_r1cs_system()
 
+        # Rows don't share lists, so editing one constraint can't change another
+        rows = [row for c in r1cs.constraints for row in (c.ai, c.bi, c.ci)]
+        self.assertEqual(len({id(row) for row in rows}), len(rows))
+
         # Relabel for convenience
         x1.out_label.rep = 'W1'
         x2.out_label.rep = 'W2'
@@ -125,6 +202,252 @@ class Web3TestCases(TestCase):
         S   = els.build_solution_vector(res)
         self.assertTrue(r1cs.is_valid_assignment(S))
 
+        # Batch evaluation, both on the uint64 path and the big-prime fallback
+        program = circuit.compile()
+        vectors = program.solve_batch(F, [[7, 3, 2], [1, 12, 5]], ['x_1', 'x_2', 'x_3'])
+        self.assertEqual(vectors[0], S)
+        self.assertTrue(r1cs.is_valid_assignment(vectors[1]))
+
+        # Largest prime the uint64 path takes, with operands that maximize each product
+        p32 = 2**32 - 5
+        F32 = ZZ/ZZ(p32)
+        x1.set_value(F32(p32 - 1))
+        x2.set_value(F32(p32 - 2))
+        x3.set_value(F32(p32 - 3))
+
+        S32 = els.build_solution_vector(circuit.execute())
+        self.assertEqual(program.solve_batch(F32, [[p32 - 1, p32 - 2, p32 - 3]], ['x_1', 'x_2', 'x_3']), [S32])
+
+        F61 = ZZ/ZZ(2**61 - 1)
+        x1.set_value(F61(2**40))
+        x2.set_value(F61(3))
+        x3.set_value(F61(2**35))
+
+        S61 = els.build_solution_vector(circuit.execute())
+        self.assertEqual(program.solve_batch(F61, [[2**35, 2**40, 3]], ['x_3', 'x_1', 'x_2']), [S61])
+
+
+
+    def test_edge_label_system(self):
+        els    = EdgeLabelSystem()
+        labels = [els.generate() for _ in range(1000)]
+
+        self.assertEqual(els[labels[500]], 500)
+        self.assertEqual(els[Label('S501')], 500)
+        self.assertIs(els['S1000'], labels[999])
+
+        labels[10].rep = 'W1'
+        self.assertIs(els['W1'], labels[10])
+        self.assertEqual(els[labels[10]], 10)
+        self.assertEqual(labels[10], Label('W1'))
+
+        with self.assertRaises(KeyError):
+            els['S11']
+
+        # Renames update the index in place instead of rebuilding it on a miss
+        labels[10].rep = 'W2'
+        self.assertIs(els['W2'], labels[10])
+        with self.assertRaises(KeyError):
+            els['W1']
+
+
+    def test_compiled_witness(self):
+        F   = ZZ/ZZ(13)
+        els = EdgeLabelSystem()
+
+        # Deep enough to hit the recursion limit if evaluated recursively
+        x1, x2 = Source(Label("x1"), els), Source(Label("x2"), els)
+        gates  = [MultiplicationGate(Label("*"), els) for _ in range(2000)]
+        res    = Sink(Label("out"), els)
+
+        x1.add_out_edge(gates[0])
+        for prev, gate in zip(gates, gates[1:]):
+            prev.add_out_edge(gate)
+
+        for gate in gates:
+            x2.add_out_edge(gate)
+
+        gates[-1].add_out_edge(res)
+
+        circuit = AlgebraicCircuit([res, x1, x2, *gates])
+        program = circuit.compile()
+
+        results = program.execute_batch([{'x1': F(3), 'x2': F(2)}, {'x1': F(5), 'x2': F(7)}])
+        self.assertEqual(results[0][gates[-1].out_label], F(3)*F(2)**2000)
+        self.assertEqual(results[1][gates[-1].out_label], F(5)*F(7)**2000)
+        self.assertEqual(results[1][x2.out_label], F(7))
+
+        x1.set_value(F(3))
+        x2.set_value(F(2))
+        self.assertEqual(circuit.execute(), results[0])
+
+
+    def test_shared_dag_r1cs(self):
+        F   = ZZ/ZZ(13)
+        els = EdgeLabelSystem()
+
+        # Every level reuses both nodes of the previous one, so a walk without memoization is 2^depth
+        x, y  = Source(Label("x"), els), Source(Label("y"), els)
+        nodes = [x, y]
+        for _ in range(50):
+            m1, m2 = MultiplicationGate(Label("*"), els), MultiplicationGate(Label("*"), els)
+            for gate in (m1, m2):
+                x.add_out_edge(gate)
+                y.add_out_edge(gate)
+
+            nodes.extend([m1, m2])
+            x, y = m1, m2
+
+        res = Sink(Label("out"), els)
+        x.add_out_edge(res)
+
+        circuit = AlgebraicCircuit([res, *nodes])
+        r1cs    = circuit.build_r1cs_system()
+        self.assertEqual(len(r1cs.constraints), 100)
+
+        circuit['x'].set_value(F(2))
+        circuit['y'].set_value(F(3))
+        self.assertTrue(r1cs.is_valid_assignment(els.build_solution_vector(circuit.execute())))
+
+
+    def test_r1cs_optimizer(self):
+        F   = ZZ/ZZ(13)
+        els = EdgeLabelSystem()
+
+        # (x + y) * z, where the addition becomes a linear (l+r)*1 = out row
+        x, y, z = Source(Label("x"), els), Source(Label("y"), els), Source(Label("z"), els)
+        a, m    = AdditionGate(Label("+"), els), MultiplicationGate(Label("*"), els)
+        res     = Sink(Label("out"), els)
+
+        x.add_out_edge(a)
+        y.add_out_edge(a)
+        a.add_out_edge(m)
+        z.add_out_edge(m)
+        m.add_out_edge(res)
+
+        circuit = AlgebraicCircuit([res, m, a, x, y, z])
+        r1cs    = circuit.build_r1cs_system()
+
+        # Duplicate and trivial rows are dropped too
+        zero = [F(0)]*len(r1cs.constraints[0].ai)
+        r1cs.constraints.append(r1cs.constraints[-1])
+        r1cs.constraints.append(R1CSConstraint(zero, zero, zero))
+
+        circuit['x'].set_value(F(3))
+        circuit['y'].set_value(F(4))
+        circuit['z'].set_value(F(5))
+        S = els.build_solution_vector(circuit.execute())
+        self.assertTrue(r1cs.is_valid_assignment(S))
+
+        opt = r1cs.optimize(F)
+        self.assertEqual(len(opt.system.constraints), 1)
+        self.assertEqual(len(opt.signals), len(S)-1)
+        self.assertTrue(opt.system.is_valid_assignment(opt.reduce(S)))
+        self.assertEqual(opt.expand(opt.reduce(S)), S)
+
+        bad     = opt.reduce(S)
+        bad[-1] = bad[-1] + 1
+        self.assertFalse(opt.system.is_valid_assignment(bad))
+
+        # Instance signals are never eliminated
+        opt = r1cs.optimize(F, num_instances=len(S))
+        self.assertEqual(opt.signals, list(range(len(S))))
+
+
+    def test_prime_field(self):
+        F  = PrimeField(13)
+        Fz = ZZ/ZZ(13)
+
+        for a, b in [(5, 7), (12, 1), (0, 3)]:
+            x, y = F(a), F(b)
+            self.assertEqual(x+y, Fz(a)+Fz(b))
+            self.assertEqual(x-y, Fz(a)-Fz(b))
+            self.assertEqual(x*y, Fz(a)*Fz(b))
+            self.assertEqual(x/y, Fz(a)/Fz(b))
+            self.assertEqual(x**5, Fz(a)**5)
+            self.assertEqual(2*x - 1, Fz(2*a - 1))
+
+        self.assertEqual(~F(5)*5, F.one)
+        for divide in (lambda: F(5) / F.zero, lambda: F(5) / 13, lambda: 5 / F.zero, lambda: ~F.zero):
+            with self.assertRaises(ZeroDivisionError):
+                divide()
+
+        self.assertEqual(F(9).sqrt()**2, F(9))
+        self.assertEqual(batch_inverse([F(k) for k in range(1, 13)]), [~F(k) for k in range(1, 13)])
+        self.assertEqual(batch_inverse([Fz(5)]), [~Fz(5)])
+
+        # Shared Lagrange basis matches samson's interpolation
+        m = [F(2), F(5), F(11)]
+        P = F[Symbol('x')]
+        for i, L in enumerate(lagrange_basis(F, m)):
+            self.assertEqual(P(L), P.interpolate([(mj, F(int(i == j))) for j, mj in enumerate(m)]))
+
+        # Drop-in for ZZ/ZZ(p) through the compiler and QAP
+        circuit, qap = Lexer().lex(SOURCE_3FAC).build(F)
+        circuit['x1'].set_value(F(7))
+        circuit['x2'].set_value(F(3))
+        circuit['x3'].set_value(F(2))
+        S = circuit.nodes[0].els.build_solution_vector(circuit.execute())
+        self.assertTrue(qap.is_valid_assignment(S))
+        self.assertEqual(qap.T.ring, F[Symbol('x')])
+
+
+    def test_circom_files(self):
+        F   = ZZ/ZZ(13)
+        els = EdgeLabelSystem()
+
+        x, y = Source(Label("x"), els), Source(Label("y"), els)
+        m    = MultiplicationGate(Label("*"), els)
+        res  = Sink(Label("out"), els)
+
+        x.add_out_edge(m)
+        y.add_out_edge(m)
+        m.add_out_edge(res)
+
+        circuit = AlgebraicCircuit([res, m, x, y])
+        r1cs    = circuit.build_r1cs_system()
+
+        circuit['x'].set_value(F(3))
+        circuit['y'].set_value(F(4))
+        S = els.build_solution_vector(circuit.execute())
+
+        with TemporaryDirectory() as tmp:
+            r1cs_path = os.path.join(tmp, 'circuit.r1cs')
+            wtns_path = os.path.join(tmp, 'witness.wtns')
+
+            write_r1cs(r1cs_path, r1cs, F, num_pub_out=1, num_prv_in=2)
+            write_wtns(wtns_path, S, F)
+
+            loaded = read_r1cs(r1cs_path)
+            self.assertEqual(loaded.F, PrimeField(13))
+            self.assertEqual(loaded.num_wires, len(S)+1)
+            self.assertEqual(loaded.num_instances, 1)
+            self.assertEqual(loaded.system, r1cs)
+            self.assertEqual(len(list(iter_r1cs_constraints(r1cs_path))), len(r1cs.constraints))
+
+            S_loaded = read_wtns(wtns_path)
+            self.assertEqual(S_loaded, S)
+            self.assertTrue(loaded.system.is_valid_assignment(S_loaded))
+
+            # The format doesn't fix the section order, so the header may come last
+            for path in (r1cs_path, wtns_path):
+                with open(path, 'rb') as f:
+                    data = f.read()
+
+                sections, pos = [], 12
+                while pos < len(data):
+                    size = int.from_bytes(data[pos+4:pos+12], 'little')
+                    sections.append(data[pos:pos+12+size])
+                    pos += 12 + size
+
+                with open(path, 'wb') as f:
+                    f.write(data[:12] + b''.join(reversed(sections)))
+
+            reordered = read_r1cs(r1cs_path)
+            self.assertEqual(reordered.system, r1cs)
+            self.assertEqual(reordered.wire_to_label, loaded.wire_to_label)
+            self.assertEqual(len(list(iter_r1cs_constraints(r1cs_path))), len(r1cs.constraints))
+            self.assertEqual(read_wtns(wtns_path), S)
 
 
     def test_3fac_asg(self):
@@ -170,6 +493,10 @@ class Web3TestCases(TestCase):
         self.assertTrue(len(main.x2.out_edges) == 1 and main.x3.out_edges[0].resolve() == main.mul2.b)
         self.assertTrue(len(main.x4.in_edges) == 1 and main.x4.in_edges[0].resolve() == main.mul2.c)
 
+        # References resolve once to a direct pointer
+        self.assertIs(main.x1.out_edges[0].resolve(), main.x1.out_edges[0].resolve())
+        self.assertIs(main.x1.out_edges[0].resolve(), main.mul1.a)
+
         # Assert mul1 connections
         self.assertTrue(len(main.mul1.a.in_edges) == 1 and main.mul1.a.in_edges[0].resolve() == main.x1)
         self.assertTrue(len(main.mul1.a.out_edges) == 1 and main.mul1.a.out_edges[0].resolve() == main.mul1.m)
@@ -233,6 +560,124 @@ class Web3TestCases(TestCase):
         S_bad[0] = F(1)
         self.assertFalse(qap.is_valid_assignment(S_bad))
 
+        # Statements may end at a semicolon or a newline, and comments are skipped
+        source = """
+        // c = a*b
+        template Multiplier() { signal input a; signal input b; signal output c; c <== a*b; }
+        template Product()
+        {
+            signal input a
+            signal input b
+            signal output c
+            component m = Multiplier()
+            m.a <== a
+            m.b <== b
+            c <== m.c
+        }
+        component main = Product()
+        """
+        prog    = Lexer().lex(source)
+        circuit = prog.components['main'].build_circuit()
+        r1cs    = circuit.build_r1cs_system()
+
+        circuit['a'].set_value(F(5))
+        circuit['b'].set_value(F(6))
+        S = prog.components['main'].els.build_solution_vector(circuit.execute())
+        self.assertEqual(len(r1cs.constraints), 1)
+        self.assertTrue(r1cs.is_valid_assignment(S))
+
+        # Binary addition as an operand of another component
+        source = """
+        template Multiplier() { signal input a; signal input b; signal output c; c <== a*b; }
+        template Affine() { signal input x; signal input y; signal output z; component m = Multiplier(); m.a <== x + y; m.b <== y; z <== m.c; }
+        component main = Affine()
+        """
+        prog         = Lexer().lex(source)
+        circuit, qap = prog.build(F)
+
+        circuit['x'].set_value(F(5))
+        circuit['y'].set_value(F(6))
+        S = prog.components['main'].els.build_solution_vector(circuit.execute())
+        self.assertEqual(circuit['z'].execute(), F(1))
+        self.assertTrue(qap.is_valid_assignment(S))
+
+        # Malformed sources report where parsing stopped
+        for source, line, column in [
+            ("template T() {\n    signal wire a\n}", 2, 12),
+            ("template T() {\n  signal input a$\n}", 2, 17),
+            ("template T() {\n  a = b\n}", 2, 3),
+            ("template T() {\n  signal input a b\n}", 2, 18),
+            ("template T() {\n  signal input a\n", 3, 1),
+            ("template T() {\n  signal output c\n  c <== a*b\n}", 3, 9),
+            ("template T() {\n  signal input a\n  b <== a\n}", 3, 3),
+            ("template T() {\n  component m = U()\n}", 2, 17),
+            ("template U() { signal input a; }\ntemplate T() {\n  signal input a\n  component m = U()\n  m.x <== a\n}", 5, 3)
+        ]:
+            with self.assertRaises(SyntaxError) as cm:
+                Lexer().lex(source)
+
+            self.assertEqual((cm.exception.lineno, cm.exception.offset), (line, column))
+
+
+    def test_nested_components(self):
+        F = ZZ/ZZ(13)
+
+        # Inputs forwarded through three levels of components
+        source = """
+        template Multiplier() { signal input a; signal input b; signal output c; c <== a*b; }
+        template Inner() { signal input a; signal input b; signal output c; component m = Multiplier(); m.a <== a; m.b <== b; c <== m.c; }
+        template Middle() { signal input a; signal input b; signal output c; component i = Inner(); i.a <== a; i.b <== b; c <== i.c; }
+        template Outer() { signal input a; signal input b; signal output c; component m = Middle(); m.a <== a; m.b <== b; c <== m.c; }
+        component main = Outer()
+        """
+        prog    = Lexer().lex(source)
+        circuit = prog.components['main'].build_circuit()
+        r1cs    = circuit.build_r1cs_system()
+
+        circuit['a'].set_value(F(5))
+        circuit['b'].set_value(F(6))
+        S = prog.components['main'].els.build_solution_vector(circuit.execute())
+        self.assertEqual(len(r1cs.constraints), 1)
+        self.assertTrue(r1cs.is_valid_assignment(S))
+
+        # Every instance is stamped out of the same compiled body
+        inner = prog.templates['Inner']
+        body  = inner.compile()
+
+        a = inner.instantiate('a')
+        b = inner.instantiate('b')
+        self.assertIs(inner.compile(), body)
+        self.assertIsNot(a.m.c, b.m.c)
+        self.assertIs(a.c.in_edges[0].resolve(), a.m.c)
+
+
+    def test_compile_cache(self):
+        F = ZZ/ZZ(13)
+
+        with TemporaryDirectory() as tmp:
+            cache        = CompileCache(tmp)
+            circuit, qap = Lexer().lex(SOURCE_3FAC).build(F, cache=cache)
+            self.assertEqual(len([f for f in os.listdir(tmp) if f.endswith('.json')]), 1)
+
+            # A fresh program over the same source hits the cache
+            prog            = Lexer().lex(SOURCE_3FAC)
+            circuit, cached = prog.build(F, cache=cache)
+            self.assertEqual(cached, qap)
+
+            circuit['x1'].set_value(F(7))
+            circuit['x2'].set_value(F(3))
+            circuit['x3'].set_value(F(2))
+            S = prog.components['main'].els.build_solution_vector(circuit.execute())
+            self.assertTrue(cached.is_valid_assignment(S))
+
+            key = CompileCache.key(SOURCE_3FAC, F, COMPILER_VERSION)
+            self.assertEqual(cache.load(key, F)[1], qap)
+            self.assertEqual(sorted(os.listdir(tmp)), [f'{key}.json', f'{key}.qap'])
+
+            # A different modulus is a different entry
+            Lexer().lex(SOURCE_3FAC).build(ZZ/ZZ(17), cache=cache)
+            self.assertEqual(len([f for f in os.listdir(tmp) if f.endswith('.json')]), 2)
+
 
     def test_3fac_CRS_example(self):
         # Compile 3fac problem into QAP
@@ -343,6 +788,18 @@ class Web3TestCases(TestCase):
         self.assertTrue(proof.verify(I))
         self.assertFalse(proof.verify([Fr(3)]))
 
+        # Cached fixed-base tables don't affect equality or hashing
+        fresh = Groth16Parameters(G1=E, G2=E6, g1=g1, g2=g2, Fr=Fr)
+        self.assertEqual(params, fresh)
+        self.assertEqual(hash(params), hash(fresh))
+
+        # Parallel prover with MSMs split into single-term chunks
+        proof = Groth16Proof.generate(crs, I, W, r=Fr(11), t=Fr(4), processes=2, chunk_size=1)
+
+        self.assertEqual(proof.g1A, E6(35, 15))
+        self.assertEqual(proof.g1C, E6(13, 28))
+        self.assertEqual(proof.g2B, E6(7*y**2, 27*y**3))
+
 
     def test_3fac_complete_compilation(self):
         # Lexer -> ASG -> Algebraic Circuit -> R1CS -> QAP
@@ -423,3 +880,310 @@ class Web3TestCases(TestCase):
         self.assertEqual(proof.g1C, E6(33, 9))
         self.assertEqual(proof.g2B, E6(42*y**2, 16*y**3))
         self.assertTrue(proof.verify(I))
+
+
+    def test_fixed_base_table(self):
+        F     = ZZ/ZZ(43)
+        y     = Symbol('y')
+        P     = F[y]
+        F43_6 = FF(43, 6, reducing_poly=y**6 + 6)
+
+        E6 = EllipticCurve(F43_6(0), F43_6(6))
+        g1 = E6(13, 15)
+        g2 = E6(7*y**2, 16*y**3)
+
+        for g in (g1, g2):
+            for window in (1, 2, 3):
+                table = FixedBaseTable(g, 13, window=window)
+                self.assertEqual(table*0, E6.zero)
+                self.assertEqual(table.batch_mul(range(-3, 30)), [g*(k % 13) for k in range(-3, 30)])
+
+            # Pippenger over Jacobian buckets, including repeated and cancelling points
+            points  = [g*k for k in range(13)] + [g, -g]
+            scalars = [(5*k + 3) % 13 for k in range(13)] + [7, 7]
+            naive   = sum([P*s for P, s in zip(points, scalars)], E6.zero)
+            self.assertEqual(msm(points, scalars, E6.zero), naive)
+            self.assertEqual(msm([g, g], [0, 0], E6.zero), E6.zero)
+
+            # Full-width scalars on very few points must not size the window by the scalar
+            wide = [2**255 - 19, 2**254 + 3]
+            self.assertEqual(msm([g], wide[:1], E6.zero), g*wide[0])
+            self.assertEqual(msm([g, g*5], wide, E6.zero), sum([P*s for P, s in zip([g, g*5], wide)], E6.zero))
+
+
+    def test_tate_pairing(self):
+        F     = ZZ/ZZ(43)
+        y     = Symbol('y')
+        P     = F[y]
+        F43_6 = FF(43, 6, reducing_poly=y**6 + 6)
+
+        E6 = EllipticCurve(F43_6(0), F43_6(6))
+        g1 = E6(13, 15)
+        g2 = E6(7*y**2, 16*y**3)
+
+        e = tate_pairing(g1, g2, 13)
+        self.assertNotEqual(e, F43_6.one)
+        self.assertEqual(e**13, F43_6.one)
+        self.assertEqual(tate_pairing(g1*3, g2*5, 13), e**15)
+        self.assertEqual(tate_pairing(E6.zero, g2, 13), F43_6.one)
+        self.assertEqual(multi_pairing([(g1*2, g2*3), (g1, g2*7)], 13), e**13)
+
+
+    def test_3fac_prepared_verifying_key(self):
+        Fr = ZZ/ZZ(13)
+        I  = [Fr(11)]
+        W  = [Fr(2), Fr(3), Fr(4), Fr(6)]
+
+        crs, y     = f43_6_crs(Fr, r1cs_3fac(Fr))
+        E6, g1, g2 = crs.params.G1, crs.params.g1, crs.params.g2
+        pvk    = crs.verifying_key().prepare()
+
+        self.assertEqual(pvk.alpha_beta, tate_pairing(g1*6, g2*5, 13))
+
+        for r, t in [(Fr(11), Fr(4)), (Fr(1), Fr(9))]:
+            proof = Groth16Proof.generate(crs, I, W, r=r, t=t)
+            self.assertTrue(pvk.verify(proof, I))
+            self.assertFalse(pvk.verify(proof, [Fr(3)]))
+
+        # (y^2, 0) has order 2, so the Miller loop would hit infinity before its last step
+        bad = Groth16Proof(proof.g1A, proof.g1C, E6(y**2, 0), crs)
+        self.assertFalse(pvk.verify(bad, I))
+        self.assertEqual(pvk.batch_verify([proof, bad], [I, I]), [True, False])
+
+
+    def test_3fac_batch_verify(self):
+        Fr = ZZ/ZZ(13)
+        I  = [Fr(11)]
+        W  = [Fr(2), Fr(3), Fr(4), Fr(6)]
+
+        crs, _ = f43_6_crs(Fr, r1cs_3fac(Fr))
+        proofs = [Groth16Proof.generate(crs, I, W, r=Fr(r), t=Fr(t)) for r, t in [(11, 4), (1, 9), (5, 2), (7, 7)]]
+
+        self.assertEqual(Groth16Proof.batch_verify(proofs, [I]*4), [True]*4)
+        self.assertEqual(Groth16Proof.batch_verify(proofs, [I, I, [Fr(3)], I], z=[1, 2, 3, 4]), [True, True, False, True])
+        self.assertEqual(Groth16Proof.batch_verify([], []), [])
+
+        # zip would silently drop the unmatched proofs
+        for args in [(proofs, [I]*3), (proofs, [I]*4, [1, 2, 3]), ([], [I])]:
+            with self.assertRaises(ValueError):
+                Groth16Proof.batch_verify(*args)
+
+
+    def test_groth16_constant_wire(self):
+        Fr = ZZ/ZZ(13)
+        I  = [Fr(9)]
+        W  = [Fr(2), Fr(3), Fr(9)]
+
+        # (x + 1)*y = v and v*1 = z, so A and B both use wire 0
+        system = R1CSSystem([
+            R1CSConstraint(
+                [Fr(1), Fr(0), Fr(1), Fr(0), Fr(0)],
+                [Fr(0), Fr(0), Fr(0), Fr(1), Fr(0)],
+                [Fr(0), Fr(0), Fr(0), Fr(0), Fr(1)]
+            ),
+            R1CSConstraint(
+                [Fr(0), Fr(0), Fr(0), Fr(0), Fr(1)],
+                [Fr(1), Fr(0), Fr(0), Fr(0), Fr(0)],
+                [Fr(0), Fr(1), Fr(0), Fr(0), Fr(0)]
+            )
+        ])
+
+        crs, _ = f43_6_crs(Fr, system)
+        proofs = [Groth16Proof.generate(crs, I, W, r=Fr(r), t=Fr(t)) for r, t in [(11, 4), (1, 9), (5, 2)]]
+
+        self.assertTrue(crs.qap.is_valid_assignment(I + W))
+        self.assertTrue(proofs[0].verify(I))
+        self.assertFalse(proofs[0].verify([Fr(8)]))
+        self.assertEqual(Groth16Proof.batch_verify(proofs, [I]*3, z=[1, 2, 3]), [True]*3)
+
+
+    def test_3fac_serialization(self):
+        Fr = ZZ/ZZ(13)
+        I  = [Fr(11)]
+        W  = [Fr(2), Fr(3), Fr(4), Fr(6)]
+
+        crs, y = f43_6_crs(Fr, r1cs_3fac(Fr))
+        params = crs.params
+        E6     = params.G1
+
+        with TemporaryDirectory() as tmp:
+            for compressed in (True, False):
+                path = os.path.join(tmp, 'crs.bin')
+                crs.write(path, compressed=compressed)
+                loaded = CRS.read(path, params)
+
+                self.assertEqual(list(loaded.CRS_G1[1]), crs.CRS_G1[1])
+                self.assertEqual(list(loaded.CRS_G1[4]), crs.CRS_G1[4])
+                self.assertEqual(list(loaded.CRS_G2[3]), crs.CRS_G2[3])
+                self.assertEqual(list(loaded.qap.Ax), crs.qap.Ax)
+
+                proof = Groth16Proof.generate(loaded, I, W, r=Fr(11), t=Fr(4))
+                self.assertEqual(proof.g1A, E6(35, 15))
+                self.assertEqual(proof.g1C, E6(13, 28))
+                self.assertEqual(proof.g2B, E6(7*y**2, 27*y**3))
+
+                # Workers only get decoded points, never the mapped file
+                pooled = Groth16Proof.generate(loaded, I, W, r=Fr(11), t=Fr(4), processes=2, chunk_size=2)
+                self.assertEqual((pooled.g1A, pooled.g1C, pooled.g2B), (proof.g1A, proof.g1C, proof.g2B))
+
+                decoded = Groth16Proof.from_bytes(proof.to_bytes(compressed), crs)
+                self.assertEqual((decoded.g1A, decoded.g1C, decoded.g2B), (proof.g1A, proof.g1C, proof.g2B))
+                self.assertTrue(decoded.verify(I))
+
+                # Unmap before the next iteration overwrites the file
+                loaded.close()
+                self.assertTrue(loaded._file.mm.closed)
+
+            with SectionFile(path) as sf:
+                self.assertEqual(sf.flags, 0)
+
+            self.assertTrue(sf.mm.closed)
+
+
+    def test_3fac_prover_service(self):
+        Fr = ZZ/ZZ(13)
+        I  = [Fr(11)]
+        W  = [Fr(2), Fr(3), Fr(4), Fr(6)]
+
+        crs, _ = f43_6_crs(Fr, r1cs_3fac(Fr))
+        params = crs.params
+
+        with TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'crs.bin')
+            crs.write(path, compressed=False)
+
+            service      = ProverService(params, processes=2, compressed=False)
+            circuit_hash = service.register_key(path)
+            jobs         = [service.submit(circuit_hash, I, W) for _ in range(3)]
+            service.close()
+
+            results = list(service.results())
+            service.shutdown()
+
+            # Submitting while another thread closes: every accepted job is still proven
+            service      = ProverService(params, processes=2, compressed=False)
+            circuit_hash = service.register_key(path)
+            accepted     = []
+
+            def submit_until_closed():
+                for _ in range(4):
+                    try:
+                        accepted.append(service.submit(circuit_hash, I, W))
+                    except RuntimeError:
+                        break
+
+            submitters = [threading.Thread(target=submit_until_closed) for _ in range(3)]
+            for thread in submitters:
+                thread.start()
+
+            service.close()
+            for thread in submitters:
+                thread.join()
+
+            drained = []
+            reader  = threading.Thread(target=lambda: drained.extend(service.results()), daemon=True)
+            reader.start()
+            reader.join(timeout=120)
+            self.assertFalse(reader.is_alive())
+            service.shutdown()
+
+        self.assertEqual(sorted([job.job_id for job in drained]), sorted([job.job_id for job in accepted]))
+
+        self.assertEqual(sorted([job.job_id for job in results]), [job.job_id for job in jobs])
+        for job in results:
+            self.assertIsNone(job.error)
+            self.assertIn('prove', job.timings)
+            self.assertTrue(Groth16Proof.from_bytes(job.proof, crs).verify(I))
+
+
+    def test_powers_of_tau(self):
+        Fr = ZZ/ZZ(13)
+        params, _ = f43_6_params(Fr)
+        g1, g2    = params.g1, params.g2
+
+        with TemporaryDirectory() as tmp:
+            paths = [os.path.join(tmp, f'pot_{i}.bin') for i in range(3)]
+            pot0  = PowersOfTau.initialize(paths[0], params, 5, compressed=False)
+            self.assertTrue(pot0.verify())
+
+            # Small chunks so contributions and checks span several of them
+            c1   = pot0.contribute(paths[1], x=Fr(3), chunk_size=2)
+            pot1 = PowersOfTau(paths[1], params)
+            c2   = pot1.contribute(paths[2], x=Fr(5), processes=2, chunk_size=2)
+            pot2 = PowersOfTau(paths[2], params)
+
+            tau = 15 % 13
+            self.assertEqual(list(pot2.g1_powers), [g1*pow(tau, j, 13) for j in range(5)])
+            self.assertEqual(list(pot2.g2_powers), [g2*pow(tau, j, 13) for j in range(5)])
+
+            self.assertTrue(pot1.verify_contribution(pot0, c1, chunk_size=3))
+            self.assertTrue(pot2.verify_contribution(pot1, c2))
+            self.assertTrue(pot2.verify())
+
+            with self.assertRaises(ValueError):
+                pot2.contribute(paths[2], x=Fr(2))
+
+            # A zero secret would wipe out tau rather than being swapped for a random one
+            for x in [Fr(0), 0, 13]:
+                with self.assertRaises(ValueError):
+                    pot2.contribute(os.path.join(tmp, 'pot_zero.bin'), x=x)
+
+            # The G1 record doesn't match the secret used
+            self.assertFalse(pot2.verify_contribution(pot1, TauContribution(g1*6, c2.g2_x)))
+
+            for pot in [pot0, pot1, pot2]:
+                pot.close()
+
+            with PowersOfTau(paths[2], params) as pot:
+                self.assertEqual(pot.num_powers, 5)
+
+            with self.assertRaises(ValueError):
+                pot.g1_powers[0]
+
+
+    def test_profiler(self):
+        Fr = PrimeField(13)
+        params, _ = f43_6_params(Fr)
+        mul       = type(Fr.one).__mul__
+
+        with Profiler(memory=True) as prof:
+            prog         = Lexer().lex(SOURCE_3FAC)
+            circuit, qap = prog.build(Fr)
+
+            circuit['x1'].set_value(Fr(7))
+            circuit['x2'].set_value(Fr(3))
+            circuit['x3'].set_value(Fr(2))
+            S    = prog.components['main'].els.build_solution_vector(circuit.execute())
+            I, W = S[:1], S[1:]
+
+            crs   = CRS.generate(qap, params, SimulationTrapdoor.generate(Fr), num_instances=len(I))
+            proof = Groth16Proof.generate(crs, I, W)
+            self.assertTrue(proof.verify(I))
+
+        stages = prof.root.children
+        self.assertEqual(list(stages), ['lex', 'build', 'crs', 'prove', 'verify'])
+        self.assertIn('qap', stages['build'].children)
+        self.assertIn('qap.evaluate', stages['prove'].children)
+        self.assertGreater(stages['build'].children['qap'].counts['field_mul'], 0)
+        self.assertEqual(stages['verify'].counts['final_exponentiation'], 1)
+        self.assertGreater(prof.totals['msm'], 0)
+        self.assertGreater(prof.root.peak_memory, 0)
+
+        report = json.loads(prof.to_json())
+        self.assertEqual(report['counts'], prof.totals)
+        self.assertTrue(any(line.startswith('total;prove;qap.evaluate ') for line in prof.folded().splitlines()))
+
+        # Nothing is left patched once the profiler exits
+        self.assertIs(type(Fr.one).__mul__, mul)
+
+
+    def test_benchmark(self):
+        # One tiny run per shape; fan-in puts the constant wire in B, which the prover must include
+        results = benchmark.run(list(benchmark.SHAPES), [2], bits=10)
+        for shape, data in results.items():
+            run = data['runs'][0]
+            self.assertEqual(run['constraints'], 2)
+            self.assertEqual(list(run['stages']), benchmark.STAGES)
+
+        runs = [{'constraints': n, 'stages': {'qap': 0.5*n**2}} for n in (4, 8, 16)]
+        self.assertAlmostEqual(benchmark.scaling_exponents(runs)['qap'], 2.0)